@@ -2,9 +2,9 @@
 import streamlit as st
 import pandas as pd
 import time
-import os
 import streamlit_authenticator as stauth
 from modules import db
+from modules.utils import region_name
 
 # ---------------------------------------------------------
 # 1. Page Configuration & Session Setup
@@ -18,9 +18,18 @@ if 'user_id' not in st.session_state:
         'models_df': pd.DataFrame(), 'engines_list': [], 'yards_list': [], 'months_list': [],
         'lang': 'English',
         'authentication_status': None, 'username': None, 'name': None,
-        'selected_vin': None
+        'selected_vin': None, 'search_args': None, 'page_no': 0,
+        'order_filters': None, 'order_cursors': [None]
     })
 
+# DB 스키마 마이그레이션은 프로세스당 1회만 실행
+@st.cache_resource
+def bootstrap_db():
+    db.init_dbs()
+    return True
+
+bootstrap_db()
+
 # ---------------------------------------------------------
 # 다국어 번역 데이터
 # ---------------------------------------------------------
@@ -44,7 +53,10 @@ TRANS = {
         'detail_view': "🚗 Vehicle Detail",
         'edit_view': "✏️ Edit Vehicle Info (My Stock)",
         'update_btn': "Update Vehicle",
-        'upload_photo': "Upload New Photos"
+        'upload_photo': "Upload New Photos",
+        'keyword': "Keyword (Model, Engine Code, VIN)",
+        'region': "Region", 'other_region': "Other",
+        'demand_analysis': "Global Demand Analysis", 'top_models': "Top Searched Models", 'top_engines': "Top Searched Engines", 'top_countries': "Top Buyer Countries"
     },
     'Korean': {
         'title': "K-중고차 글로벌 허브",
@@ -65,7 +77,10 @@ TRANS = {
         'detail_view': "🚗 차량 상세 정보",
         'edit_view': "✏️ 매물 정보 수정 (내 차량)",
         'update_btn': "정보 업데이트 저장",
-        'upload_photo': "새로운 사진 업로드"
+        'upload_photo': "새로운 사진 업로드",
+        'keyword': "키워드 검색 (모델, 엔진코드, 차대번호)",
+        'region': "지역", 'other_region': "기타",
+        'demand_analysis': "글로벌 수요 분석", 'top_models': "인기 검색 차종", 'top_engines': "인기 검색 엔진", 'top_countries': "국가별 검색"
     },
     'Russian': {
         'title': "Глобальный центр корейских авто",
@@ -86,7 +101,10 @@ TRANS = {
         'detail_view': "🚗 Детали выбранного автомобиля",
         'edit_view': "✏️ Редактировать (Мой склад)",
         'update_btn': "Обновить",
-        'upload_photo': "Загрузить фото"
+        'upload_photo': "Загрузить фото",
+        'keyword': "Поиск (модель, код двигателя, VIN)",
+        'region': "Регион", 'other_region': "Другие",
+        'demand_analysis': "Анализ спроса", 'top_models': "Топ моделей", 'top_engines': "Топ двигателей", 'top_countries': "Топ стран"
     },
     'Arabic': {
         'title': "المركز العالمي للسيارات الكورية",
@@ -107,7 +125,10 @@ TRANS = {
         'detail_view': "🚗 تفاصيل السيارة المختارة",
         'edit_view': "✏️ تعديل المعلومات (مخزوني)",
         'update_btn': "تحديث",
-        'upload_photo': "تحميل صور جديدة"
+        'upload_photo': "تحميل صور جديدة",
+        'keyword': "بحث (الموديل، رمز المحرك، VIN)",
+        'region': "المنطقة", 'other_region': "أخرى",
+        'demand_analysis': "تحليل الطلب العالمي", 'top_models': "أفضل الموديلات بحثًا", 'top_engines': "أفضل المحركات بحثًا", 'top_countries': "أكثر الدول بحثًا"
     }
 }
 
@@ -118,6 +139,11 @@ def t(key):
 # ---------------------------------------------------------
 # [기능] 상단 상세 뷰
 # ---------------------------------------------------------
+def photo_src(photo, size):
+    # 변환본(thumb/medium)이 있으면 그것을, 생성 전/실패면 원본 경로
+    src = photo.get(f'{size}_path')
+    return src if isinstance(src, str) and src else photo['path']
+
 def render_top_detail_view(container, row, role, my_company):
     with container:
         with st.container(border=True):
@@ -132,11 +158,10 @@ def render_top_detail_view(container, row, role, my_company):
                 with st.form(key=f"edit_form_{row['vin']}"):
                     c1, c2 = st.columns([1, 1.5])
                     with c1:
-                        img_str = str(row.get('photos', ''))
-                        images = [img.strip() for img in img_str.split(',') if img.strip()]
-                        if images and os.path.exists(images[0]):
-                            st.image(images[0], width=300)
-                            st.caption(f"Photos: {len(images)}")
+                        photos = db.get_vehicle_photos(row['vin'])
+                        if not photos.empty and pd.notna(photos['size'].iloc[0]):
+                            st.image(photo_src(photos.iloc[0], 'thumb'), width=300)
+                            st.caption(f"Photos: {len(photos)}")
                         else: st.info("No Image")
                         new_files = st.file_uploader(t('upload_photo'), accept_multiple_files=True, type=['png','jpg','jpeg'])
                     with c2:
@@ -156,16 +181,16 @@ def render_top_detail_view(container, row, role, my_company):
                 st.subheader(f"{t('detail_view')} : {row['model_name']} ({row['vin']})")
                 col1, col2 = st.columns([1, 1.5])
                 with col1:
-                    img_str = str(row.get('photos', ''))
-                    images = [img.strip() for img in img_str.split(',') if img.strip()]
-                    if images:
-                        if os.path.exists(images[0]): st.image(images[0], use_container_width=True)
+                    photos = db.get_vehicle_photos(row['vin'])
+                    if not photos.empty:
+                        first = photos.iloc[0]
+                        if pd.notna(first['size']): st.image(photo_src(first, 'medium'), use_container_width=True)
                         else: st.warning("Image missing")
-                        if len(images) > 1:
-                            with st.expander(f"📸 More Photos ({len(images)-1})"):
+                        if len(photos) > 1:
+                            with st.expander(f"📸 More Photos ({len(photos)-1})"):
                                 sub_cols = st.columns(3)
-                                for i, img in enumerate(images[1:]):
-                                    if os.path.exists(img): sub_cols[i % 3].image(img, use_container_width=True)
+                                for i, (_, p) in enumerate(photos.iloc[1:].iterrows()):
+                                    if pd.notna(p['size']): sub_cols[i % 3].image(photo_src(p, 'thumb'), use_container_width=True)
                     else: st.info("🖼️ No Images Available")
 
                 with col2:
@@ -185,6 +210,9 @@ def render_top_detail_view(container, row, role, my_company):
                     
                     st.divider()
                     st.markdown(f"**Location (Yard):** {display_yard}")
+                    # 주소 미등록 폐차장은 address_local 이 NULL → 지역 줄 숨김
+                    if role == 'buyer' and pd.notna(row.get('address_local')) and row.get('address_local'):
+                        st.markdown(f"**{t('region')}:** {row['address_local']}")
                     st.markdown(f"**Reg Date:** {str(row['reg_date'])[:10]}")
                     
                     if st.button("📩 Send Inquiry", type="primary", use_container_width=True):
@@ -219,6 +247,100 @@ def show_signup_expander():
                     else:
                         st.warning("Please fill in ID and Password.")
 
+# ---------------------------------------------------------
+# 검색 결과 페이지 이동 (키셋 커서)
+# ---------------------------------------------------------
+def render_pager(key):
+    args = st.session_state.get('search_args')
+    df = st.session_state.view_data
+    if not args or df.empty: return
+    page_no = st.session_state.page_no
+    pages = max(1, -(-st.session_state.total_count // db.PAGE_SIZE))
+    
+    c1, c2, c3 = st.columns([1, 2, 1])
+    go_prev = c1.button("◀ Prev", key=f"prev_{key}", disabled=page_no == 0, use_container_width=True)
+    c2.markdown(f"<div style='text-align:center'>Page {page_no + 1} / {pages}</div>", unsafe_allow_html=True)
+    go_next = c3.button("Next ▶", key=f"next_{key}", disabled=page_no + 1 >= pages, use_container_width=True)
+    
+    if go_prev or go_next:
+        direction = 'next' if go_next else 'prev'
+        first, last = db.page_cursors(df)
+        new_df, _ = db.search_data(*args, cursor=last if go_next else first, direction=direction, with_count=False, lang=st.session_state.lang)
+        if not new_df.empty:
+            st.session_state.view_data = new_df
+            st.session_state.page_no = page_no + (1 if go_next else -1)
+            st.session_state.selected_vin = None
+        st.rerun()
+
+# ---------------------------------------------------------
+# 주문함 (상태/기간 필터 + 키셋 페이지, 보이는 페이지만 위젯 생성)
+# ---------------------------------------------------------
+def render_order_inbox(role):
+    uid = st.session_state.user_id
+    f1, f2, f3 = st.columns([1.2, 1, 1])
+    date_from = f2.date_input("From", value=None, key="ord_from")
+    date_to = f3.date_input("To", value=None, key="ord_to")
+    counts = db.order_status_counts(uid, role, date_from, date_to)
+    total = sum(counts.values())
+    status = f1.selectbox("Status", [None] + db.ORDER_STATUSES, key="ord_status",
+                          format_func=lambda s: f"All ({total:,})" if s is None else f"{s} ({counts.get(s, 0):,})")
+
+    # 필터가 바뀌면 첫 페이지로 (페이지별 시작 커서 스택)
+    filters = (status, date_from, date_to)
+    if st.session_state.get('order_filters') != filters:
+        st.session_state.order_filters = filters
+        st.session_state.order_cursors = [None]
+    cursors = st.session_state.order_cursors
+    orders = db.get_orders(uid, role, status, date_from, date_to, cursors[-1])
+    if orders.empty:
+        st.info("No orders.")
+        return
+
+    matched = counts.get(status, 0) if status else total
+    pages = max(1, -(-matched // db.ORDER_PAGE_SIZE))
+    c1, c2, c3 = st.columns([1, 2, 1])
+    go_prev = c1.button("◀ Prev", key="ord_prev", disabled=len(cursors) == 1, use_container_width=True)
+    c2.markdown(f"<div style='text-align:center'>Page {len(cursors)} / {pages}</div>", unsafe_allow_html=True)
+    go_next = c3.button("Next ▶", key="ord_next", disabled=len(cursors) >= pages, use_container_width=True)
+    if go_prev or go_next:
+        if go_next: cursors.append(db.order_cursor(orders))
+        else: cursors.pop()
+        st.rerun()
+
+    if role == 'partner' or role == 'admin':
+        # 현재 페이지 표에서 여러 건 선택 → 상태/답변 일괄 적용 (한 트랜잭션, rerun 1회)
+        cols = ['id', 'created_at', 'buyer_id', 'real_junkyard_name', 'items_summary', 'status', 'reply_text']
+        event = st.dataframe(orders[cols], use_container_width=True, hide_index=True, on_select="rerun",
+                             selection_mode="multi-row", key=f"ord_tbl_{len(cursors)}_{status}_{date_from}_{date_to}")
+        picked = orders.iloc[event.selection.rows] if event.selection.rows else orders.iloc[0:0]
+        with st.form("ord_bulk"):
+            st.write(f"**Selected:** {len(picked)} / {len(orders)}")
+            b1, b2 = st.columns([1, 2])
+            new_status = b1.selectbox("Status", [None] + db.ORDER_STATUSES, format_func=lambda s: "(keep)" if s is None else s)
+            first_reply = picked['reply_text'].iloc[0] if len(picked) == 1 and isinstance(picked['reply_text'].iloc[0], str) else ""
+            reply_txt = b2.text_area("Reply", value=first_reply, key=f"ord_reply_{'_'.join(map(str, picked['id']))}")
+            if st.form_submit_button("Apply to selected", type="primary", disabled=picked.empty):
+                n = db.update_orders(picked['id'].tolist(), new_status, reply_txt.strip(),
+                                     partner=st.session_state.user_id if role == 'partner' else None)
+                st.success(f"{n} orders updated.")
+                st.rerun()
+    else:
+        st.dataframe(orders, use_container_width=True)
+
+# 패싯 개수를 붙인 옵션 라벨 (검색 결과 기준 개수가 없으면 0)
+def facet_label(counts):
+    if not counts: return lambda v: v
+    return lambda v: f"{v} ({counts.get(v, 0):,})"
+
+def render_facet_summary(facets):
+    parts = []
+    if facets.get('year_bucket'):
+        parts.append(f"**{t('year_range')}:** " + " · ".join(f"{k} ({v:,})" for k, v in facets['year_bucket'].items()))
+    if facets.get('region'):
+        lang = st.session_state.get('lang', 'English')
+        parts.append(f"**{t('region')}:** " + " · ".join(f"{region_name(k, lang) or t('other_region')} ({v:,})" for k, v in facets['region'].items()))
+    if parts: st.caption("  \n".join(parts))
+
 # ---------------------------------------------------------
 # [공통] 마켓플레이스 UI
 # ---------------------------------------------------------
@@ -230,7 +352,11 @@ def render_marketplace_ui(role):
         if st.session_state.models_df.empty:
             db.reset_dashboard()
         m_df = st.session_state.models_df
+        # 마지막 검색 조건의 패싯 개수 (검색 전에는 전체 재고 기준)
+        args = st.session_state.get('search_args')
+        facets = db.facet_counts(*args) if args else db.facet_totals()
         
+        keyword = st.text_input(t('keyword'), placeholder="G4KE, Sorento 2.2, KNAKU81...")
         c1, c2, c3 = st.columns(3)
         with c1:
             mfr_list = ["All"] + sorted(m_df['manufacturer'].unique().tolist())
@@ -239,7 +365,7 @@ def render_marketplace_ui(role):
             models_for_mfr = []
             if sel_mfr != "All":
                 models_for_mfr = sorted(m_df[m_df['manufacturer'] == sel_mfr]['model_name'].unique().tolist())
-            sel_models = st.multiselect(t('model'), models_for_mfr)
+            sel_models = st.multiselect(t('model'), models_for_mfr, format_func=facet_label(facets.get('model_name')))
         with c3:
             sy, ey = st.slider(t('year_range'), 1990, 2025, (2000, 2025))
 
@@ -251,7 +377,7 @@ def render_marketplace_ui(role):
             else:
                 sm, em = "2000-01", "2025-12"
         with c5:
-            sel_engines = st.multiselect(t('engine_code'), st.session_state.engines_list)
+            sel_engines = st.multiselect(t('engine_code'), st.session_state.engines_list, format_func=facet_label(facets.get('engine_code')))
         with c6:
             if role == 'buyer':
                 st.selectbox(t('junkyard'), ["All Partners (Hidden)"], disabled=True)
@@ -260,7 +386,7 @@ def render_marketplace_ui(role):
                 my_yard = st.session_state.user_company
                 sel_yards = st.multiselect(t('junkyard'), [my_yard], default=[my_yard], disabled=True)
             else:
-                sel_yards = st.multiselect(t('junkyard'), st.session_state.yards_list)
+                sel_yards = st.multiselect(t('junkyard'), st.session_state.yards_list, format_func=facet_label(facets.get('junkyard')))
 
         st.divider()
         cb1, cb2, cb3, cb4 = st.columns([1, 1, 1, 1])
@@ -270,15 +396,15 @@ def render_marketplace_ui(role):
             chk_price = st.checkbox(t('price_only'))
         with cb3:
             if st.button(t('search_btn_veh'), type="primary", use_container_width=True):
-                df, count = db.search_data(
-                    sel_mfr, sel_models, [], sel_engines, 
-                    sy, ey, sel_yards, sm, em, 
-                    only_photo=chk_photo, only_price=chk_price
-                )
+                search_args = (sel_mfr, sel_models, [], sel_engines, sy, ey, sel_yards, sm, em, chk_photo, chk_price, keyword.strip())
+                df, count = db.search_data(*search_args, lang=st.session_state.lang, user_id=st.session_state.user_id)
                 st.session_state.view_data = df
                 st.session_state.total_count = count
                 st.session_state.is_filtered = True
-                st.session_state.selected_vin = None 
+                st.session_state.selected_vin = None
+                st.session_state.search_args = search_args
+                st.session_state.page_no = 0
+                st.rerun()
         with cb4:
             if st.button(t('reset'), use_container_width=True):
                 db.reset_dashboard()
@@ -289,6 +415,9 @@ def render_marketplace_ui(role):
     
     with tab_veh:
         st.write(f"{t('total')}: {st.session_state.total_count}")
+        if st.session_state.get('search_args'):
+            render_facet_summary(db.facet_counts(*st.session_state.search_args))
+        render_pager('veh')
         df = st.session_state.view_data
         if not df.empty:
             display_df = df.copy()
@@ -308,6 +437,7 @@ def render_marketplace_ui(role):
             st.info("No vehicles found.")
 
     with tab_eng:
+        render_pager('eng')
         df = st.session_state.view_data
         if not df.empty:
             df_eng = df[df['engine_code'].notna() & (df['engine_code'] != '')].copy()
@@ -327,24 +457,7 @@ def render_marketplace_ui(role):
 
     with tab_order:
         st.subheader(t('my_orders'))
-        orders = db.get_orders(st.session_state.user_id, role)
-        if not orders.empty:
-            if role == 'partner' or role == 'admin':
-                for index, row in orders.iterrows():
-                    with st.expander(f"{row['created_at'][:16]} - {row['items_summary']} ({row['status']})"):
-                        st.write(f"**Buyer:** {row['buyer_id']}")
-                        st.write(f"**Target:** {row['real_junkyard_name']}")
-                        st.write(f"**Details:** {row['items_summary']}")
-                        new_status = st.selectbox("Status", ["PENDING", "CONFIRMED", "SHIPPED", "CANCELLED"], key=f"st_{row['id']}", index=["PENDING", "CONFIRMED", "SHIPPED", "CANCELLED"].index(row['status']) if row['status'] in ["PENDING", "CONFIRMED", "SHIPPED", "CANCELLED"] else 0)
-                        reply_txt = st.text_area("Reply", value=row['reply_text'] if row['reply_text'] else "", key=f"rp_{row['id']}")
-                        if st.button("Update", key=f"upd_{row['id']}"):
-                            db.update_order(row['id'], new_status, reply_txt)
-                            st.success("Updated")
-                            st.rerun()
-            else:
-                st.dataframe(orders, use_container_width=True)
-        else:
-            st.info("No orders.")
+        render_order_inbox(role)
 
     with tab_yard:
         if role == 'admin':
@@ -359,12 +472,43 @@ def render_marketplace_ui(role):
 # ---------------------------------------------------------
 # 관리자 대시보드
 # ---------------------------------------------------------
+# 재표준화 백그라운드 작업 진행 표시 (실행 중에는 이 부분만 1초마다 갱신)
+@st.fragment(run_every=1)
+def render_standardize_progress():
+    job = db.standardize_job_status()
+    if job['running']:
+        frac = job['done'] / job['total'] if job['total'] else 0.0
+        st.progress(frac, text=f"Standardizing... {job['done']:,} / {job['total']:,} rows")
+    elif job['error']:
+        st.error(f"Standardization failed: {job['error']}")
+    elif job['changed'] is not None:
+        st.success(f"Standardized {job['changed']} vehicles in DB.")
+
+# 수요 대시보드: 집계 테이블(demand_hourly / demand_daily)만 읽음
+def render_demand_dashboard():
+    periods = {"24 hours": 24, "7 days": 24 * 7, "30 days": 24 * 30, "90 days": 24 * 90}
+    hours = periods[st.radio("Period", list(periods), index=1, horizontal=True, key="demand_period")]
+    trend = db.demand_trend(hours)
+    st.metric("Searches", f"{int(trend['searches'].sum()) if not trend.empty else 0:,}")
+    if not trend.empty:
+        st.line_chart(trend.set_index('bucket')['searches'])
+    c1, c2, c3 = st.columns(3)
+    for col, dim, label in [(c1, 'model', 'top_models'), (c2, 'engine', 'top_engines'), (c3, 'country', 'top_countries')]:
+        with col:
+            st.markdown(f"**{t(label)}**")
+            top = db.demand_top(dim, hours)
+            if top.empty: st.caption("No searches yet.")
+            else: st.bar_chart(top.set_index('value')['searches'], horizontal=True)
+
 def admin_dashboard():
-    main_tab1, main_tab2, main_tab3 = st.tabs(["🔍 Marketplace", "👥 User Management", "📂 Data Upload"])
+    main_tab1, main_tab2, main_tab3, main_tab4 = st.tabs(["🔍 Marketplace", "👥 User Management", "📂 Data Upload", f"📈 {t('demand_analysis')}"])
     
     with main_tab1:
         render_marketplace_ui('admin')
 
+    with main_tab4:
+        render_demand_dashboard()
+
     with main_tab2:
         st.subheader("User Management")
         users_df = db.fetch_all_users()
@@ -402,21 +546,49 @@ def admin_dashboard():
         with st.expander("2. Vehicle Stock Upload"):
             v_files = st.file_uploader("Stock Excel", type=['xlsx', 'xls', 'csv'], accept_multiple_files=True)
             if v_files:
+                use_parallel = len(v_files) > 1 and st.checkbox("Parallel upload (multi-core)", value=True)
                 if st.button("Upload Stock"):
-                    total_cnt = 0
-                    for f in v_files:
-                        total_cnt += db.save_vehicle_file(f)
-                    st.success(f"Total {total_cnt} vehicles uploaded from {len(v_files)} files.")
+                    bar = st.progress(0.0, text="Uploading...")
+                    if use_parallel:
+                        def on_file_done(done, total, res):
+                            bar.progress(done / total, text=f"{res['file']}: {res['rows']:,} rows")
+                        results = db.save_vehicle_files_parallel(v_files, progress=on_file_done)
+                    else:
+                        results = []
+                        for i, f in enumerate(v_files):
+                            def on_progress(rows, frac, i=i, f=f):
+                                bar.progress(min(1.0, (i + (frac or 0)) / len(v_files)), text=f"{f.name}: {rows:,} rows")
+                            results.append(db.save_vehicle_file_stream(f, progress=on_progress))
+                    bar.progress(1.0, text="Done")
+                    total_cnt = sum(r['rows'] for r in results)
+                    changed_cnt = sum(r['changed'] for r in results)
+                    st.dataframe(pd.DataFrame(results), use_container_width=True, hide_index=True)
+                    for r in results:
+                        if r['error']: st.error(f"{r['file']}: {r['error']}")
+                    st.success(f"Total {total_cnt} vehicles read from {len(v_files)} files: {changed_cnt} new or changed, {total_cnt - changed_cnt} unchanged.")
 
         if st.button("🔄 Standardize All Existing Data"):
-            cnt = db.standardize_existing_data()
-            st.success(f"Standardized {cnt} vehicles in DB.")
+            if not db.start_standardize_job(): st.warning("Standardization is already running.")
+        render_standardize_progress()
 
         with st.expander("3. Partner Info Upload (Junkyard Address)"):
             p_file = st.file_uploader("Partner Excel (Name, Address)", type=['xlsx', 'xls'])
             if p_file and st.button("Upload Partners"):
                 cnt = db.save_address_file(p_file)
                 st.success(f"{cnt} partners updated.")
+            if st.button("🌐 Rebuild Partner Address Translations"):
+                cnt = db.backfill_junkyard_addresses()
+                st.success(f"{cnt} partners re-translated.")
+            if st.button("🧹 Clean Up Unused Photos"):
+                r = db.gc_photo_blobs()
+                st.success(f"{r['files']} files removed ({r['bytes'] / 1e6:.1f} MB).")
+
+        with st.expander("Query Cache"):
+            st.json(db.query_cache_stats())
+            st.json(db.columnar_stats())
+            st.json(db.rendition_stats())
+            st.json(db.mail_outbox_stats())
+            st.json(db.search_log_stats())
 
 # ---------------------------------------------------------
 # 일반 사용자 (바이어/파트너) 대시보드
@@ -0,0 +1,115 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+
+from modules import db
+
+# ---------------------------------------------------------
+# 컬럼형 엔진 vs SQLite 벤치마크 (합성 재고)
+# 사용법: python bench_columnar.py [행 수=1000000]
+# ---------------------------------------------------------
+MAKERS = {
+    'Hyundai': ['Grandeur', 'Sonata', 'Avante', 'Santa Fe', 'Tucson', 'Palisade', 'Starex'],
+    'Kia': ['K5', 'K7', 'Sorento', 'Carnival', 'Sportage', 'Morning', 'Ray'],
+    'Genesis': ['G80', 'G90', 'GV80'],
+    'Mercedes-Benz': ['S-Class', 'E-Class', 'C-Class'],
+    'BMW': ['5 Series', '3 Series', 'X5'],
+}
+ENGINES = ['G4KE', 'G4KJ', 'D4HB', 'G6DH', 'L4KA', 'D4CB', 'G4FG', 'M274', 'B48', 'N20']
+YARDS = [f"yard{i:03d}" for i in range(150)]
+
+def make_rows(n, seed=42):
+    rng = np.random.default_rng(seed)
+    pairs = [(m, mod) for m, mods in MAKERS.items() for mod in mods]
+    # 인기 모델 쏠림 (Zipf 분포)
+    pick = np.minimum(rng.zipf(1.3, n) - 1, len(pairs) - 1)
+    year = rng.integers(2005, 2025, n)
+    month = rng.integers(1, 13, n)
+    day = rng.integers(1, 29, n)
+    reg_year = np.minimum(year + rng.integers(0, 3, n), 2025)
+    eng = rng.integers(0, len(ENGINES), n)
+    yard = rng.integers(0, len(YARDS), n)
+    price = np.where(rng.random(n) < 0.3, rng.integers(500, 20000, n), 0)
+    photos = np.where(rng.random(n) < 0.2, 'data/vehicle_images/x.jpg', '')
+    for i in range(n):
+        mfr, model = pairs[pick[i]]
+        yield (f"KN{i:015d}", f"{reg_year[i]}-{month[i]:02d}-{day[i]:02d}", f"{i % 100}가{i % 10000:04d}", mfr, model, '',
+               int(year[i]), YARDS[yard[i]], ENGINES[eng[i]], int(reg_year[i] * 100 + month[i]), int(price[i]), str(photos[i]),
+               int(photos[i] != ''))
+
+QUERIES = [
+    ('all, default range', ("All", [], [], [], 1990, 2025, [], "2000-01", "2025-12", False, False, '')),
+    ('maker', ("Kia", [], [], [], 1990, 2025, [], "2000-01", "2025-12", False, False, '')),
+    ('maker+model', ("Hyundai", ['Grandeur'], [], [], 1990, 2025, [], "2000-01", "2025-12", False, False, '')),
+    ('last 12 months', ("All", [], [], [], 1990, 2025, [], "2024-01", "2024-12", False, False, '')),
+    ('engine+years', ("All", [], [], ['G4KE', 'D4HB'], 2015, 2020, [], "2000-01", "2025-12", False, False, '')),
+    ('yard+photo', ("All", [], [], [], 1990, 2025, [YARDS[7]], "2000-01", "2025-12", True, False, '')),
+    ('rare model+price', ("BMW", ['X5'], [], [], 2010, 2025, [], "2000-01", "2025-12", False, True, '')),
+    ('keyword', ("All", [], [], [], 1990, 2025, [], "2000-01", "2025-12", False, False, 'G4KE')),
+]
+
+def timed(fn, repeat):
+    best = []
+    for _ in range(repeat):
+        t = time.perf_counter(); r = fn(); best.append(time.perf_counter() - t)
+    return float(np.median(best)) * 1000, r
+
+def run(n_rows):
+    work = tempfile.mkdtemp(prefix='bench_columnar_')
+    db.USE_COLUMNAR_ENGINE = True
+    db.INVENTORY_DB = os.path.join(work, 'inventory.db')
+    try:
+        print(f"1. 합성 재고 {n_rows:,}행 생성 중... ({db.INVENTORY_DB})")
+        t = time.time()
+        with db.write_conn(db.INVENTORY_DB) as conn:
+            db.run_migrations(conn, db.INVENTORY_MIGRATIONS)
+        # 사진 필터는 photo_count 기준 → vehicle_photos 없이 개수만 직접 채움
+        fields = ', '.join(db.VEHICLE_ROW_FIELDS + ['price', 'photos', 'photo_count'])
+        rows = make_rows(n_rows)
+        while True:
+            chunk = [r for _, r in zip(range(100000), rows)]
+            if not chunk: break
+            with db.write_conn(db.INVENTORY_DB) as conn:
+                conn.executemany(f"INSERT INTO vehicle_data ({fields}) VALUES ({', '.join(['?'] * 13)})", chunk)
+        with db.write_conn(db.INVENTORY_DB) as conn:
+            db.analyze_inventory(conn)
+        db.bump_generation('inventory')
+        print(f"   {time.time() - t:.1f}s")
+
+        print("2. 컬럼형 엔진 구축")
+        eng = db.columnar_engine(wait=True)
+        stats = db.columnar_stats()
+        print(f"   {stats['last_build']['seconds']}s, {stats['memory_mb']} MB")
+
+        print("3. 조회 (캐시 미사용, 중앙값 ms: 건수 + 첫 페이지)")
+        print(f"   {'query':<20}{'rows':>10}{'sql':>10}{'columnar':>10}{'speedup':>9}")
+        for name, args in QUERIES:
+            def sql():
+                cond, params = db.build_search_filter(*args)
+                with db.read_conn(db.INVENTORY_DB) as conn:
+                    cnt = conn.execute(f"SELECT COUNT(*) FROM vehicle_data v WHERE {cond}", params).fetchone()[0]
+                return cnt, db._sql_search_page(*args, None, 'next', db.PAGE_SIZE)
+            def col():
+                eng.memo.clear()
+                cnt = len(db._columnar_select(eng, *args))
+                return cnt, db._columnar_search_page(eng, *args, None, 'next', db.PAGE_SIZE)
+            t_sql, (c1, p1) = timed(sql, 5)
+            t_col, (c2, p2) = timed(col, 5)
+            same = c1 == c2 and p1['vin'].tolist() == p2['vin'].tolist()
+            print(f"   {name:<20}{c1:>10,}{t_sql:>10.1f}{t_col:>10.1f}{t_sql / t_col:>8.1f}x{'' if same else '  MISMATCH'}")
+
+        print("4. 증분 갱신 (가격 1,000건 수정)")
+        with db.write_conn(db.INVENTORY_DB) as conn:
+            conn.execute("UPDATE vehicle_data SET price = 1234 WHERE rowid % ? = 0", (max(1, n_rows // 1000),))
+        db.bump_generation('inventory')
+        db.columnar_engine(wait=True)
+        print(f"   {db.columnar_stats()['last_build']}")
+    finally:
+        db.close_connections()
+        shutil.rmtree(work, ignore_errors=True)
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
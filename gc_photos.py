@@ -0,0 +1,15 @@
+import sys
+
+from modules import db
+
+# ---------------------------------------------------------
+# 사진 저장소 정리: 참조되지 않는 사진/변환본 파일 삭제
+# 사용법: python gc_photos.py [--dry-run]
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    dry_run = '--dry-run' in sys.argv[1:]
+    with db.write_conn(db.INVENTORY_DB) as conn:
+        db.run_migrations(conn, db.INVENTORY_MIGRATIONS)
+    r = db.gc_photo_blobs(dry_run=dry_run)
+    db.close_connections()
+    print(f"{'(dry run) ' if dry_run else ''}파일 {r['files']:,}개, {r['bytes'] / 1e6:.1f} MB 정리, blob {r['blobs']:,}건")
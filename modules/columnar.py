@@ -0,0 +1,205 @@
+# modules/columnar.py
+import copy
+import numpy as np
+import pandas as pd
+
+# ---------------------------------------------------------
+# 인메모리 컬럼형 재고 엔진 (NumPy 배열 + 값별 역색인)
+# ---------------------------------------------------------
+# - 행은 화면 정렬 순서(reg_month, reg_date, vin DESC)대로 저장 → 페이지 = 후보 위치 배열의 연속 구간
+# - 정렬키는 바이트 반전한 고정폭 복합키(S dtype) 하나로 보관 → 오름차순 searchsorted 로 커서/삽입 위치 계산
+# - 문자열 컬럼은 사전 인코딩(int32 코드), 값별 행 위치 목록을 CSR(offsets + positions)로 보관 (압축 비트맵)
+# - 객체는 만들어진 뒤 바뀌지 않음: apply_changes 는 새 엔진을 돌려주므로 조회 중인 스레드와 충돌 없음
+
+CATEGORICAL = ['manufacturer', 'model_name', 'model_detail', 'engine_code', 'junkyard']
+SNAPSHOT_COLUMNS = ['rid', 'vin', 'reg_date', 'reg_month'] + CATEGORICAL + ['model_year', 'has_price', 'has_photo']
+_MONTH_OFFSET = 2 ** 31
+
+def _encode(values, width=None):
+    # 문자열 → UTF-8 바이트 (SQLite BINARY 정렬과 같은 순서)
+    arr = np.char.encode(pd.Series(values, dtype=object).fillna('').astype(str).values.astype('U'), 'utf-8')
+    return arr if width is None else arr.astype(f'S{max(width, 1)}')
+
+def _sort_keys(month, date, vin, date_w, vin_w):
+    # (month, date, vin) 내림차순 == 반전 바이트 복합키 오름차순
+    # 패딩(\x00)도 반전되어 \xff 가 되므로 'abc' 는 'abcd' 뒤에 옴 (내림차순과 일치)
+    n = len(month)
+    buf = np.zeros((n, 4 + date_w + vin_w), dtype=np.uint8)
+    buf[:, :4] = (month.astype(np.int64) + _MONTH_OFFSET).astype('>u4').view(np.uint8).reshape(n, 4)
+    buf[:, 4:4 + date_w] = date.astype(f'S{date_w}').view(np.uint8).reshape(n, date_w)
+    buf[:, 4 + date_w:] = vin.astype(f'S{vin_w}').view(np.uint8).reshape(n, vin_w)
+    return (255 - buf).view(f'S{buf.shape[1]}').ravel()
+
+class ColumnarInventory:
+    def __init__(self, generation=None):
+        self.generation = generation
+        self.n = 0
+        self.memo = {}
+
+    # -----------------------------------------------------
+    # 구축
+    # -----------------------------------------------------
+    @classmethod
+    def from_frame(cls, frame, generation=None):
+        # frame: SNAPSHOT_COLUMNS (db.load_columnar_snapshot)
+        eng = cls(generation)
+        month = frame['reg_month'].fillna(-1).astype(np.int64).values
+        date, vin = _encode(frame['reg_date']), _encode(frame['vin'])
+        eng.date_w = max(date.dtype.itemsize, 10)
+        eng.vin_w = max(vin.dtype.itemsize, 17)
+        key = _sort_keys(month, date, vin, eng.date_w, eng.vin_w)
+        order = np.argsort(key, kind='stable')
+
+        eng.key = key[order]
+        eng.month = month[order].astype(np.int32)
+        eng.rid = frame['rid'].values.astype(np.int64)[order]
+        eng.year = pd.to_numeric(frame['model_year'], errors='coerce').values.astype(np.float32)[order]
+        eng.has_price = frame['has_price'].fillna(0).values.astype(bool)[order]
+        eng.has_photo = frame['has_photo'].fillna(0).values.astype(bool)[order]
+        eng.codes, eng.values, eng.lookup = {}, {}, {}
+        for col in CATEGORICAL:
+            codes, uniques = pd.factorize(frame[col].values[order])
+            eng.codes[col] = codes.astype(np.int32)
+            eng.values[col] = list(uniques)
+            eng.lookup[col] = {v: i for i, v in enumerate(uniques)}
+        eng._finish()
+        return eng
+
+    def _finish(self):
+        self.n = len(self.rid)
+        # 월 범위 → 연속 구간 (month 는 내림차순이므로 부호 반전해 오름차순 검색)
+        self.neg_month = -self.month
+        self.rid_order = np.argsort(self.rid, kind='stable')
+        self.rid_sorted = self.rid[self.rid_order]
+        # 값별 행 위치 (CSR): code k 의 위치 = pos[off[k + 1]:off[k + 2]] (k = -1 은 NULL)
+        self.postings = {}
+        for col in CATEGORICAL:
+            shifted = self.codes[col].astype(np.int64) + 1
+            pos = np.argsort(shifted, kind='stable')
+            off = np.concatenate([[0], np.cumsum(np.bincount(shifted, minlength=len(self.values[col]) + 1))])
+            self.postings[col] = (pos, off)
+
+    def apply_changes(self, changed_rids, frame, generation=None):
+        # changed_rids 의 기존 행을 지우고 frame(현재 값)을 정렬 위치에 끼워 넣은 새 엔진 반환
+        # 폭이 넓은 키가 들어오면 None → 호출 측에서 전체 재구축
+        keep = ~np.isin(self.rid, np.asarray(list(changed_rids), dtype=np.int64))
+        month = frame['reg_month'].fillna(-1).astype(np.int64).values
+        date, vin = _encode(frame['reg_date']), _encode(frame['vin'])
+        if date.dtype.itemsize > self.date_w or vin.dtype.itemsize > self.vin_w: return None
+
+        eng = ColumnarInventory(generation)
+        eng.date_w, eng.vin_w = self.date_w, self.vin_w
+        new_key = _sort_keys(month, date, vin, self.date_w, self.vin_w)
+        order = np.argsort(new_key, kind='stable')
+        new_key = new_key[order]
+        kept_key = self.key[keep]
+        at = np.searchsorted(kept_key, new_key, side='right')
+
+        def merge(old, new): return np.insert(old[keep], at, new[order])
+        eng.key = np.insert(kept_key, at, new_key)
+        eng.month = merge(self.month, month.astype(np.int32))
+        eng.rid = merge(self.rid, frame['rid'].values.astype(np.int64))
+        eng.year = merge(self.year, pd.to_numeric(frame['model_year'], errors='coerce').values.astype(np.float32))
+        eng.has_price = merge(self.has_price, frame['has_price'].fillna(0).values.astype(bool))
+        eng.has_photo = merge(self.has_photo, frame['has_photo'].fillna(0).values.astype(bool))
+        eng.codes, eng.values, eng.lookup = {}, {}, {}
+        for col in CATEGORICAL:
+            # 새 값은 사전 끝에 추가 (사라진 값은 빈 목록으로 남음)
+            values, lookup = list(self.values[col]), dict(self.lookup[col])
+            new_codes = np.empty(len(frame), dtype=np.int32)
+            for i, v in enumerate(frame[col].values):
+                if v is None or (isinstance(v, float) and np.isnan(v)): new_codes[i] = -1; continue
+                if v not in lookup:
+                    lookup[v] = len(values); values.append(v)
+                new_codes[i] = lookup[v]
+            eng.codes[col] = merge(self.codes[col], new_codes)
+            eng.values[col], eng.lookup[col] = values, lookup
+        eng._finish()
+        return eng
+
+    def retag(self, generation):
+        # 데이터 변경 없이 세대만 올린 사본 (배열 공유)
+        eng = copy.copy(self)
+        eng.generation = generation
+        return eng
+
+    # -----------------------------------------------------
+    # 조회
+    # -----------------------------------------------------
+    def positions_of(self, rids):
+        # rowid 배열 → 정렬 위치 배열 (없는 rowid 제외, 오름차순)
+        rids = np.asarray(rids, dtype=np.int64)
+        if self.n == 0 or len(rids) == 0: return np.empty(0, dtype=np.int64)
+        i = np.searchsorted(self.rid_sorted, rids).clip(0, self.n - 1)
+        hit = self.rid_sorted[i] == rids
+        return np.sort(self.rid_order[i[hit]])
+
+    def _posting(self, col, values):
+        pos, off = self.postings[col]
+        codes = [self.lookup[col][v] for v in values if v in self.lookup[col]]
+        parts = [pos[off[c + 1]:off[c + 2]] for c in codes]
+        if not parts: return np.empty(0, dtype=np.int64)
+        return parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+
+    def select(self, categorical, year_range, month_range, only_photo=False, only_price=False, positions=None):
+        # categorical: {컬럼: [값, ...]} (빈 목록은 필터 없음), positions: FTS 등 외부 후보 위치
+        # → 조건을 만족하는 정렬 위치 (오름차순 = 화면 순서)
+        # 검색값을 배열 dtype으로 맞춰야 배열 전체 형변환(O(N))이 일어나지 않음
+        lo = np.searchsorted(self.neg_month, np.int32(-month_range[1]), side='left')
+        hi = np.searchsorted(self.neg_month, np.int32(-month_range[0]), side='right')
+        filters = [(col, vals) for col, vals in categorical.items() if vals]
+
+        # 가장 작은 역색인 목록에서 출발 → 나머지 범주 조건은 후보 위치에서만 확인
+        cands = None
+        if filters:
+            sized = []
+            for col, vals in filters:
+                codes = [self.lookup[col][v] for v in vals if v in self.lookup[col]]
+                if not codes: return np.empty(0, dtype=np.int64)
+                off = self.postings[col][1]
+                sized.append((sum(off[c + 2] - off[c + 1] for c in codes), col, vals, codes))
+            sized.sort(key=lambda x: x[0])
+            cands = self._posting(sized[0][1], sized[0][2])
+            cands = cands[(cands >= lo) & (cands < hi)]
+            for _, col, _, codes in sized[1:]:
+                c = self.codes[col][cands]
+                cands = cands[c == codes[0]] if len(codes) == 1 else cands[np.isin(c, codes)]
+        if positions is not None:
+            positions = positions[(positions >= lo) & (positions < hi)]
+            cands = positions if cands is None else np.intersect1d(cands, positions, assume_unique=True)
+        if cands is None:
+            cands = np.arange(lo, hi, dtype=np.int64)
+
+        y = self.year[cands]
+        mask = (y >= year_range[0]) & (y <= year_range[1])
+        if only_photo: mask &= self.has_photo[cands]
+        if only_price: mask &= self.has_price[cands]
+        return cands[mask]
+
+    def mask(self, col, cands, values):
+        # 후보 위치 중 col 값이 values 에 속하는 위치 (bool 배열)
+        codes = [self.lookup[col][v] for v in values if v in self.lookup[col]]
+        return np.isin(self.codes[col][cands], codes)
+
+    def value_counts(self, col, cands):
+        # 후보 위치의 값별 개수 {값: 개수} (NULL 제외)
+        cnt = np.bincount(self.codes[col][cands] + 1, minlength=len(self.values[col]) + 1)[1:]
+        return {self.values[col][i]: int(cnt[i]) for i in np.flatnonzero(cnt)}
+
+    def cursor_key(self, cursor):
+        month, date, vin = cursor
+        return _sort_keys(np.array([int(month)]), _encode([date]), _encode([vin]), self.date_w, self.vin_w)[0]
+
+    def page(self, cands, cursor=None, direction='next', size=200):
+        # 키셋 페이지: next = 커서보다 뒤(작은 키), prev = 커서보다 앞 → 항상 화면 순서로 반환
+        if direction == 'next':
+            start = 0 if cursor is None else np.searchsorted(cands, np.searchsorted(self.key, self.cursor_key(cursor), side='right'))
+            return cands[start:start + size]
+        end = len(cands) if cursor is None else np.searchsorted(cands, np.searchsorted(self.key, self.cursor_key(cursor), side='left'))
+        return cands[max(0, end - size):end]
+
+    def memory_bytes(self):
+        total = sum(a.nbytes for a in [self.key, self.month, self.neg_month, self.rid, self.rid_order, self.rid_sorted,
+                                       self.year, self.has_price, self.has_photo])
+        total += sum(self.codes[c].nbytes + self.postings[c][0].nbytes + self.postings[c][1].nbytes for c in CATEGORICAL)
+        return total
@@ -25,6 +25,14 @@ CITY_MAP = {
     '양주': 'Yangju', '포천': 'Pocheon', '여주': 'Yeoju', '연천': 'Yeoncheon', '가평': 'Gapyeong', '양평': 'Yangpyeong'
 }
 
+# 시/도 표준 코드 (ISO 3166-2:KR), PROVINCE_MAP 의 영문명 기준
+REGION_CODES = {
+    'Seoul': 'KR-11', 'Busan': 'KR-26', 'Daegu': 'KR-27', 'Incheon': 'KR-28', 'Gwangju': 'KR-29',
+    'Daejeon': 'KR-30', 'Ulsan': 'KR-31', 'Sejong': 'KR-50', 'Gyeonggi-do': 'KR-41', 'Gangwon-do': 'KR-42',
+    'Chungbuk': 'KR-43', 'Chungnam': 'KR-44', 'Jeonbuk': 'KR-45', 'Jeonnam': 'KR-46',
+    'Gyeongbuk': 'KR-47', 'Gyeongnam': 'KR-48', 'Jeju': 'KR-49'
+}
+
 PROVINCE_MAP_RU = {
     '경기': 'Кёнгидо', '서울': 'Сеул', '인천': 'Инчхон', '강원': 'Канвондо', '충북': 'Чхунбук', 
     '충남': 'Чхуннам', '대전': 'Тэджон', '세종': 'Седжон', '전북': 'Чонбук', '전남': 'Чоннам', 
@@ -1,19 +1,151 @@
 # modules/db.py
 import sqlite3
 import pandas as pd
+import numpy as np
 import datetime
+import calendar
 import os
 import re
+import json
+import uuid
+import random
 import shutil
 import io
+import codecs
+import queue
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache
 import streamlit as st
 import streamlit_authenticator as stauth
 from modules.constants import RAW_TRANSLATIONS
+from modules.utils import junkyard_address_fields, UNKNOWN_ADDRESS
+from modules.normalizer import Normalizer
+from modules.query_cache import QueryCache
+from modules.columnar import ColumnarInventory
+from modules import images
+from modules import mailer
 
 INVENTORY_DB = 'data/inventory.db'
 SYSTEM_DB = 'data/system.db'
 IMAGE_DIR = 'data/vehicle_images'
 
+# ---------------------------------------------------------
+# 연결 관리 (프로세스 공용 풀)
+# ---------------------------------------------------------
+# 읽기: DB별 커넥션 풀에서 빌려 쓰고 반납 (Streamlit 스크립트 스레드가 매 rerun마다 바뀌므로 스레드 로컬 대신 풀 사용)
+# 쓰기: DB별 단일 writer 커넥션 + 락으로 직렬화 → WAL 모드에서 읽기는 쓰기에 막히지 않음
+READ_POOL_SIZE = 8
+SQLITE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",      # 64MB page cache
+    "PRAGMA mmap_size=268435456",    # 256MB mmap
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA recursive_triggers=ON",  # REPLACE 삭제 시에도 DELETE 트리거 실행 (FTS 동기화)
+]
+
+_pool_lock = threading.Lock()
+_read_pools = {}
+_writers = {}
+
+def _connect(path):
+    d = os.path.dirname(path)
+    if d and not os.path.exists(d): os.makedirs(d)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    for p in SQLITE_PRAGMAS:
+        conn.execute(p)
+    return conn
+
+def _get_writer(path):
+    with _pool_lock:
+        if path not in _writers:
+            _writers[path] = (_connect(path), threading.RLock())
+        return _writers[path]
+
+@contextmanager
+def read_conn(path):
+    with _pool_lock:
+        pool = _read_pools.setdefault(path, queue.LifoQueue(maxsize=READ_POOL_SIZE))
+    try: conn = pool.get_nowait()
+    except queue.Empty: conn = _connect(path)
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction: conn.rollback()
+        try: pool.put_nowait(conn)
+        except queue.Full: conn.close()
+
+@contextmanager
+def write_conn(path):
+    conn, lock = _get_writer(path)
+    with lock:
+        try:
+            yield conn
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+
+# 데이터 세대 카운터: 쓰기 함수가 올리고, 캐시는 세대가 바뀌었을 때만 다시 계산
+_generations = {}
+
+def bump_generation(name):
+    with _pool_lock:
+        _generations[name] = _generations.get(name, 0) + 1
+        return _generations[name]
+
+def get_generation(name):
+    return _generations.get(name, 0)
+
+# 다른 프로세스의 직접 쓰기(clean_db.py 등) 감지: writer 커넥션의 PRAGMA data_version 은
+# 다른 커넥션이 커밋했을 때만 바뀜 → 이 프로세스의 쓰기(변환본 갱신, GC 등)는 세대 카운터로만 반영
+# writer 가 다른 스레드에서 쓰기 중이면 확인을 건너뛰고 직전 값 사용 (다음 조회에서 다시 확인)
+_external = {}      # path → (마지막 data_version, 외부 커밋 감지 횟수)
+
+def external_writes(path):
+    conn, lock = _get_writer(path)
+    if lock.acquire(blocking=False):
+        try:
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            seen, count = _external.get(path, (version, 0))
+            _external[path] = (version, count + (version != seen))
+        finally:
+            lock.release()
+    return _external.get(path, (None, 0))[1]
+
+def inventory_generation():
+    return (get_generation('inventory'), external_writes(INVENTORY_DB))
+
+# 재고 조회 결과 캐시: 세션 공용, inventory 세대가 바뀔 때까지 메모리에서 응답
+QUERY_CACHE_SIZE = 512
+QUERY_CACHE = QueryCache(QUERY_CACHE_SIZE)
+inventory_cached = QUERY_CACHE.cached(inventory_generation)
+# 사진 목록: 변환본 생성 완료(photos 세대)에도 갱신 (변환본 갱신은 재고 검색 캐시를 무효화하지 않음)
+photos_cached = QUERY_CACHE.cached(lambda: (inventory_generation(), get_generation('photos')))
+orders_cached = QUERY_CACHE.cached(lambda: get_generation('orders'))
+demand_cached = QUERY_CACHE.cached(lambda: get_generation('demand'))
+
+def query_cache_stats():
+    return dict(QUERY_CACHE.stats(), generation=inventory_generation())
+
+def close_connections():
+    with _pool_lock:
+        for pool in _read_pools.values():
+            while not pool.empty(): pool.get_nowait().close()
+        for conn, lock in _writers.values():
+            with lock: conn.close()
+        _read_pools.clear()
+        _writers.clear()
+        # 새 커넥션의 data_version 은 기준이 다르므로 다음 확인을 외부 커밋으로 간주 (횟수는 유지 → 세대가 되돌아가지 않음)
+        for path, (_, count) in list(_external.items()): _external[path] = (None, count)
+        # 변경 추적 TEMP 트리거는 닫힌 writer 와 함께 사라짐 → 다음 갱신에서 다시 설치하고 전체 재구축
+        _columnar.update(engine=None, tracking=False, external=None)
+
 # ---------------------------------------------------------
 # 0. 데이터 표준화 규칙
 # ---------------------------------------------------------
@@ -63,6 +195,8 @@ MODEL_MAP = {
 
 BRAND_REMOVE_REGEX = r"^(현대|기아|제네시스|르노|쉐보레|쌍용|벤츠|메르세데스|비엠|아우디|폭스바겐|볼보|렉서스|도요타|혼다|닛산|랜드로버|포르쉐|미니|재규어|지프|포드|HYUNDAI|KIA|GENESIS|BENZ|BMW|AUDI|VOLVO|LEXUS|TOYOTA|HONDA|NISSAN|LANDROVER|PORSCHE|MINI|JAGUAR|JEEP|FORD)\s*"
 
+NORMALIZER = Normalizer(BRAND_MAP, MODEL_MAP, BRAND_REMOVE_REGEX, GARBAGE_TERMS)
+
 # ---------------------------------------------------------
 # 1. 초기화 및 유틸리티
 # ---------------------------------------------------------
@@ -70,28 +204,321 @@ def init_dbs():
     if not os.path.exists('data'): os.makedirs('data')
     if not os.path.exists(IMAGE_DIR): os.makedirs(IMAGE_DIR)
     
-    conn = sqlite3.connect(INVENTORY_DB)
-    c = conn.cursor()
+    with write_conn(INVENTORY_DB) as conn:
+        run_migrations(conn, INVENTORY_MIGRATIONS)
+    with write_conn(SYSTEM_DB) as conn:
+        run_migrations(conn, SYSTEM_MIGRATIONS)
+        _seed_system(conn.cursor())
+    bump_generation('inventory')
+    bump_generation('users')
+    start_rendition_worker()
+    start_mail_sender()
+    start_search_log_writer()
+
+def run_migrations(conn, migrations):
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY, name TEXT, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    current = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+    applied = []
+    for version, name, fn in migrations:
+        if version <= current: continue
+        # 마이그레이션 단위로 트랜잭션 (DDL 포함)
+        conn.execute("BEGIN")
+        try:
+            fn(conn.cursor())
+            conn.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)", (version, name))
+            conn.commit()
+        except:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+def _table_columns(c, table):
+    return [r[1] for r in c.execute(f"PRAGMA table_info({table})").fetchall()]
+
+def rebuild_fts():
+    # vehicle_fts는 rowid 기준이므로 VACUUM 등으로 rowid가 바뀐 뒤에는 재구축 필요
+    with write_conn(INVENTORY_DB) as conn:
+        conn.execute("INSERT INTO vehicle_fts (vehicle_fts) VALUES ('rebuild')")
+
+def rebuild_facets(conn):
+    # 패싯 테이블 전체 재계산 (마이그레이션 백필 / 외부 스크립트로 vehicle_data를 직접 수정한 뒤)
+    for table, cols in FACET_TABLES.items():
+        keys = ', '.join(cols)
+        exprs = ', '.join(_facet_key(c) for c in cols)
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"INSERT INTO {table} ({keys}, cnt) SELECT {exprs}, COUNT(*) FROM vehicle_data GROUP BY {exprs}")
+
+def backfill_junkyard_addresses(conn=None):
+    # junkyard_info 의 address_en/ru/ar, region_code 재계산 (번역 규칙 변경 후 관리자 버튼으로도 실행)
+    if conn is None:
+        with write_conn(INVENTORY_DB) as conn:
+            n = backfill_junkyard_addresses(conn)
+        bump_generation('inventory')
+        return n
+    rows = conn.execute("SELECT name, address FROM junkyard_info").fetchall()
+    conn.executemany("UPDATE junkyard_info SET address_en = ?, address_ru = ?, address_ar = ?, region_code = ? WHERE name = ?",
+                     [junkyard_address_fields(addr) + (name,) for name, addr in rows])
+    return len(rows)
+
+def split_photo_paths(photo_str):
+    # 구버전 photos 문자열('a.jpg,b.jpg') → 경로 목록 (중복 제거, 순서 유지)
+    return list(dict.fromkeys(p.strip() for p in str(photo_str or '').split(',') if p.strip()))
+
+def photo_metadata(path):
+    # (path, size, width, height, sha256) — 파일이 없으면 path 외 전부 None (화면에서 '이미지 없음' 처리)
+    try:
+        size, digest = os.path.getsize(path), images.file_sha256(path)
+    except OSError:
+        return path, None, None, None, None
+    return (path, size) + tuple(images.image_size(path)) + (digest,)
+
+def insert_vehicle_photos(conn, vin, photos):
+    # photos: [(path, size, width, height, sha256), ...]
+    # 사진 행 추가 → 트리거가 vehicle_data.photo_count, photo_blobs.refcount 갱신
+    # 이미 변환본이 있는 같은 파일이면 변환본 경로도 이어받음
+    conn.executemany("INSERT OR IGNORE INTO photo_blobs (sha256, path, size) VALUES (?, ?, ?)",
+                     [(p[4], p[0], p[1]) for p in photos if p[4]])
+    conn.executemany('''INSERT OR IGNORE INTO vehicle_photos (vin, path, size, width, height, sha256, thumb_path, medium_path)
+                        SELECT ?, ?, ?, ?, ?, ?, r.thumb_path, r.medium_path
+                        FROM (SELECT 1) LEFT JOIN (SELECT thumb_path, medium_path FROM vehicle_photos
+                                                   WHERE path = ? AND thumb_path != '' LIMIT 1) r''',
+                     [(vin,) + tuple(p) + (p[0],) for p in photos])
+
+def analyze_inventory(conn):
+    # 대량 적재 후 플래너 통계 갱신 (analysis_limit로 대용량에서도 빠르게)
+    conn.execute("PRAGMA analysis_limit=2000")
+    conn.execute("ANALYZE vehicle_data")
+    conn.execute("ANALYZE junkyard_info")
+
+# --- inventory.db ---
+def _m001_inventory_base(c):
     c.execute('''CREATE TABLE IF NOT EXISTS vehicle_data (
         vin TEXT PRIMARY KEY, reg_date TEXT, car_no TEXT, manufacturer TEXT, 
         model_name TEXT, model_detail TEXT, model_year REAL, junkyard TEXT, engine_code TEXT, 
         price REAL DEFAULT 0, mileage REAL DEFAULT 0, photos TEXT,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
     
-    for col in ['model_detail', 'price', 'mileage', 'photos']:
-        try: c.execute(f"ALTER TABLE vehicle_data ADD COLUMN {col} TEXT DEFAULT ''" if col == 'photos' or col == 'model_detail' else f"ALTER TABLE vehicle_data ADD COLUMN {col} REAL DEFAULT 0")
-        except: pass
+    # 구버전 DB 호환: 누락된 컬럼만 추가
+    cols = _table_columns(c, 'vehicle_data')
+    for col, ddl in [('model_detail', "TEXT DEFAULT ''"), ('price', 'REAL DEFAULT 0'), ('mileage', 'REAL DEFAULT 0'), ('photos', "TEXT DEFAULT ''")]:
+        if col not in cols: c.execute(f"ALTER TABLE vehicle_data ADD COLUMN {col} {ddl}")
 
     c.execute('''CREATE TABLE IF NOT EXISTS junkyard_info (
         name TEXT PRIMARY KEY, address TEXT, region TEXT, lat REAL, lon REAL, 
         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
     c.execute('''CREATE TABLE IF NOT EXISTS model_list (
         manufacturer TEXT, model_name TEXT, PRIMARY KEY (manufacturer, model_name))''')
-    conn.commit()
-    conn.close()
 
-    conn = sqlite3.connect(SYSTEM_DB)
-    c = conn.cursor()
+def _m002_vehicle_indexes(c):
+    # 마켓플레이스 필터 조합별 인덱스 (정렬키 reg_date를 뒤에 두어 ORDER BY 정렬 제거)
+    # - 제조사/모델 선택: 연식까지 포함한 커버링 인덱스로 COUNT(*)도 인덱스만 읽음
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_mfr_model_reg ON vehicle_data (manufacturer, model_name, reg_date, model_year)")
+    # - 제조사 All: reg_date 역순 스캔 후 LIMIT
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_reg ON vehicle_data (reg_date, model_year)")
+    # - 엔진 코드 / 파트너(폐차장) 필터
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_engine_reg ON vehicle_data (engine_code, reg_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_yard_reg ON vehicle_data (junkyard, reg_date)")
+    # - 세부모델 (제조사 → 모델 → 세부모델 3Depth)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_model_detail ON vehicle_data (model_name, model_detail)")
+    # - 가격/사진 공개 매물 체크박스: 부분 인덱스
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_priced_reg ON vehicle_data (reg_date) WHERE price > 0")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_photo_reg ON vehicle_data (reg_date) WHERE photos IS NOT NULL AND photos != ''")
+    analyze_inventory(c.connection)
+
+def _m003_reg_month(c):
+    # 등록일자 ISO 정규화 + 정수 등록월(YYYYMM) 컬럼 백필 (고유값 단위로 처리)
+    if 'reg_month' not in _table_columns(c, 'vehicle_data'):
+        c.execute("ALTER TABLE vehicle_data ADD COLUMN reg_month INTEGER")
+    raw_dates = [r[0] for r in c.execute("SELECT DISTINCT reg_date FROM vehicle_data WHERE reg_date IS NOT NULL").fetchall()]
+    updates = []
+    for raw in raw_dates:
+        iso, month = normalize_reg_date(raw)
+        updates.append((iso, month, raw))
+    c.executemany("UPDATE vehicle_data SET reg_date = ?, reg_month = ? WHERE reg_date = ?", updates)
+
+    # reg_date 단독 인덱스 → (reg_month, reg_date) 인덱스로 교체
+    # 정렬은 ORDER BY reg_month DESC, reg_date DESC (reg_date 정렬과 동일 순서)로 인덱스 순서를 그대로 사용
+    for idx in ['idx_vd_mfr_model_reg', 'idx_vd_reg', 'idx_vd_engine_reg', 'idx_vd_yard_reg', 'idx_vd_priced_reg', 'idx_vd_photo_reg']:
+        c.execute(f"DROP INDEX IF EXISTS {idx}")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_mfr_model_month ON vehicle_data (manufacturer, model_name, reg_month, reg_date, model_year)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_month ON vehicle_data (reg_month, reg_date, model_year)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_engine_month ON vehicle_data (engine_code, reg_month, reg_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_yard_month ON vehicle_data (junkyard, reg_month, reg_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_priced_month ON vehicle_data (reg_month, reg_date) WHERE price > 0")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_photo_month ON vehicle_data (reg_month, reg_date) WHERE photos IS NOT NULL AND photos != ''")
+    analyze_inventory(c.connection)
+
+def _m004_keyset_indexes(c):
+    # 키셋 페이지네이션용: 정렬키 끝에 vin 추가 → (reg_month, reg_date, vin) 순서를 인덱스로 바로 제공
+    for idx in ['idx_vd_mfr_model_month', 'idx_vd_month', 'idx_vd_engine_month', 'idx_vd_yard_month', 'idx_vd_priced_month', 'idx_vd_photo_month']:
+        c.execute(f"DROP INDEX IF EXISTS {idx}")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_mfr_model_page ON vehicle_data (manufacturer, model_name, reg_month, reg_date, vin, model_year)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_page ON vehicle_data (reg_month, reg_date, vin, model_year)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_engine_page ON vehicle_data (engine_code, reg_month, reg_date, vin)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_yard_page ON vehicle_data (junkyard, reg_month, reg_date, vin)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_priced_page ON vehicle_data (reg_month, reg_date, vin) WHERE price > 0")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_photo_page ON vehicle_data (reg_month, reg_date, vin) WHERE photos IS NOT NULL AND photos != ''")
+    analyze_inventory(c.connection)
+
+def _m005_vehicle_fts(c):
+    # 모델/세부모델/엔진코드/VIN 전문검색 (external content → vehicle_data rowid 기준, 트리거로 동기화)
+    # INSERT OR REPLACE의 삭제도 트리거가 받도록 recursive_triggers=ON (SQLITE_PRAGMAS)
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS vehicle_fts USING fts5(
+        vin, manufacturer, model_name, model_detail, engine_code,
+        content='vehicle_data', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2', prefix='2 3')''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS vehicle_fts_ai AFTER INSERT ON vehicle_data BEGIN
+        INSERT INTO vehicle_fts (rowid, vin, manufacturer, model_name, model_detail, engine_code)
+        VALUES (new.rowid, new.vin, new.manufacturer, new.model_name, new.model_detail, new.engine_code);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS vehicle_fts_ad AFTER DELETE ON vehicle_data BEGIN
+        INSERT INTO vehicle_fts (vehicle_fts, rowid, vin, manufacturer, model_name, model_detail, engine_code)
+        VALUES ('delete', old.rowid, old.vin, old.manufacturer, old.model_name, old.model_detail, old.engine_code);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS vehicle_fts_au AFTER UPDATE OF vin, manufacturer, model_name, model_detail, engine_code ON vehicle_data BEGIN
+        INSERT INTO vehicle_fts (vehicle_fts, rowid, vin, manufacturer, model_name, model_detail, engine_code)
+        VALUES ('delete', old.rowid, old.vin, old.manufacturer, old.model_name, old.model_detail, old.engine_code);
+        INSERT INTO vehicle_fts (rowid, vin, manufacturer, model_name, model_detail, engine_code)
+        VALUES (new.rowid, new.vin, new.manufacturer, new.model_name, new.model_detail, new.engine_code);
+    END''')
+    c.execute("INSERT INTO vehicle_fts (vehicle_fts) VALUES ('rebuild')")
+
+# 필터 위젯용 패싯 테이블: 키 조합별 행 수를 vehicle_data 트리거로 증감 유지
+# NULL 키는 ''/0 으로 저장 (PRIMARY KEY 비교가 NULL에서 동작하지 않으므로)
+FACET_TABLES = {
+    'facet_model': ['manufacturer', 'model_name', 'model_detail'],
+    'facet_engine': ['engine_code'],
+    'facet_month': ['reg_month'],
+    'facet_yard': ['junkyard'],
+}
+
+def _facet_key(col, ref=None):
+    default = '0' if col == 'reg_month' else "''"
+    return f"COALESCE({ref + '.' if ref else ''}{col}, {default})"
+
+def _m006_facet_tables(c):
+    for table, cols in FACET_TABLES.items():
+        keys = ', '.join(cols)
+        match_old = ' AND '.join(f"{col} = {_facet_key(col, 'old')}" for col in cols)
+        inc_new = (f"INSERT INTO {table} ({keys}, cnt) VALUES ({', '.join(_facet_key(col, 'new') for col in cols)}, 1) "
+                   f"ON CONFLICT({keys}) DO UPDATE SET cnt = cnt + 1;")
+        dec_old = (f"UPDATE {table} SET cnt = cnt - 1 WHERE {match_old}; "
+                   f"DELETE FROM {table} WHERE {match_old} AND cnt <= 0;")
+        changed = ' OR '.join(f"old.{col} IS NOT new.{col}" for col in cols)
+        c.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(cols)}, cnt INTEGER NOT NULL DEFAULT 0, PRIMARY KEY ({keys}))")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON vehicle_data BEGIN {inc_new} END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON vehicle_data BEGIN {dec_old} END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {keys} ON vehicle_data WHEN {changed} BEGIN {dec_old} {inc_new} END")
+    rebuild_facets(c.connection)
+
+def _m007_junkyard_i18n(c):
+    # 바이어 화면용 다국어 주소/지역 코드를 폐차장별로 한 번만 계산해 저장
+    cols = _table_columns(c, 'junkyard_info')
+    for col in ['address_en', 'address_ru', 'address_ar', 'region_code']:
+        if col not in cols: c.execute(f"ALTER TABLE junkyard_info ADD COLUMN {col} TEXT")
+    backfill_junkyard_addresses(c.connection)
+
+def _m008_vehicle_photos(c):
+    # 사진 경로 문자열 → 정규화 테이블 (파일 메타데이터는 저장 시 한 번만 계산)
+    # vehicle_data.photo_count 는 트리거로 유지 → '사진 있는 매물' 필터가 부분 인덱스 조회
+    c.execute('''CREATE TABLE IF NOT EXISTS vehicle_photos (
+        id INTEGER PRIMARY KEY, vin TEXT NOT NULL, path TEXT NOT NULL,
+        size INTEGER, width INTEGER, height INTEGER, sha256 TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, UNIQUE (vin, path))''')
+    if 'photo_count' not in _table_columns(c, 'vehicle_data'):
+        c.execute("ALTER TABLE vehicle_data ADD COLUMN photo_count INTEGER NOT NULL DEFAULT 0")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS vehicle_photos_ai AFTER INSERT ON vehicle_photos BEGIN
+        UPDATE vehicle_data SET photo_count = photo_count + 1 WHERE vin = new.vin;
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS vehicle_photos_ad AFTER DELETE ON vehicle_photos BEGIN
+        UPDATE vehicle_data SET photo_count = photo_count - 1 WHERE vin = old.vin;
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS vehicle_data_photos_ad AFTER DELETE ON vehicle_data BEGIN
+        DELETE FROM vehicle_photos WHERE vin = old.vin;
+    END''')
+
+    c.execute("DELETE FROM vehicle_photos")
+    c.execute("UPDATE vehicle_data SET photo_count = 0 WHERE photo_count != 0")
+    # 이 시점 스키마 그대로 INSERT (insert_vehicle_photos 는 이후 마이그레이션의 테이블/컬럼을 사용)
+    for vin, photo_str in c.execute("SELECT vin, photos FROM vehicle_data WHERE photos IS NOT NULL AND photos != ''").fetchall():
+        c.executemany("INSERT OR IGNORE INTO vehicle_photos (vin, path, size, width, height, sha256) VALUES (?, ?, ?, ?, ?, ?)",
+                      [(vin,) + photo_metadata(p) for p in split_photo_paths(photo_str)])
+
+    c.execute("DROP INDEX IF EXISTS idx_vd_photo_page")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_photo_page ON vehicle_data (reg_month, reg_date, vin) WHERE photo_count > 0")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vp_vin ON vehicle_photos (vin, id)")
+    analyze_inventory(c.connection)
+
+def _m009_photo_renditions(c):
+    # 변환본 경로 (NULL = 생성 대기, '' = 생성 실패 → 원본 사용)
+    cols = _table_columns(c, 'vehicle_photos')
+    for col in ['thumb_path', 'medium_path']:
+        if col not in cols: c.execute(f"ALTER TABLE vehicle_photos ADD COLUMN {col} TEXT")
+
+def _m010_photo_blobs(c):
+    # 내용 주소 사진 저장소: sha256 별 파일 한 벌 + 참조 수 (vehicle_photos 트리거로 유지)
+    # 참조 수 0 인 blob 과 어디서도 참조하지 않는 파일은 gc_photo_blobs 에서 삭제
+    c.execute('''CREATE TABLE IF NOT EXISTS photo_blobs (
+        sha256 TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER,
+        refcount INTEGER NOT NULL DEFAULT 0, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS photo_blobs_ref_ai AFTER INSERT ON vehicle_photos WHEN new.sha256 IS NOT NULL BEGIN
+        UPDATE photo_blobs SET refcount = refcount + 1 WHERE sha256 = new.sha256;
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS photo_blobs_ref_ad AFTER DELETE ON vehicle_photos WHEN old.sha256 IS NOT NULL BEGIN
+        UPDATE photo_blobs SET refcount = refcount - 1 WHERE sha256 = old.sha256;
+    END''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vp_path ON vehicle_photos (path)")
+
+    # 기존 파일: 같은 내용이면 가장 먼저 등록된 경로로 통일 (나머지 사본은 GC 대상), 변환본은 다시 생성
+    c.execute('''DELETE FROM vehicle_photos WHERE sha256 IS NOT NULL
+                 AND id > (SELECT MIN(p.id) FROM vehicle_photos p WHERE p.vin = vehicle_photos.vin AND p.sha256 = vehicle_photos.sha256)''')
+    c.execute('''UPDATE vehicle_photos SET path = (SELECT p.path FROM vehicle_photos p WHERE p.sha256 = vehicle_photos.sha256 ORDER BY p.id LIMIT 1),
+                 thumb_path = NULL, medium_path = NULL
+                 WHERE sha256 IS NOT NULL AND path != (SELECT p.path FROM vehicle_photos p WHERE p.sha256 = vehicle_photos.sha256 ORDER BY p.id LIMIT 1)''')
+    c.execute('''UPDATE vehicle_data SET photos = (SELECT group_concat(path, ',') FROM (SELECT path FROM vehicle_photos p WHERE p.vin = vehicle_data.vin ORDER BY p.id))
+                 WHERE photo_count > 0''')
+    c.execute("DELETE FROM photo_blobs")
+    c.execute('''INSERT INTO photo_blobs (sha256, path, size, refcount)
+                 SELECT sha256, MIN(path), MAX(size), COUNT(*) FROM vehicle_photos WHERE sha256 IS NOT NULL GROUP BY sha256''')
+
+def _m011_norm_version(c):
+    # 표준화 규칙 버전: normalizer_rules 에 규칙 지문이 바뀔 때마다 버전 추가 (단조 증가)
+    # 행마다 적용된 버전을 저장 → norm_version < 현재 버전인 행만 재표준화 (인덱스 범위 조회)
+    c.execute('''CREATE TABLE IF NOT EXISTS normalizer_rules (
+        version INTEGER PRIMARY KEY, digest TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    if 'norm_version' not in _table_columns(c, 'vehicle_data'):
+        c.execute("ALTER TABLE vehicle_data ADD COLUMN norm_version INTEGER NOT NULL DEFAULT 0")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vd_norm_version ON vehicle_data (norm_version, manufacturer, model_name)")
+
+def _m012_fix_reg_dates(c):
+    # 이전 정규화가 통과시킨 달력에 없는 날짜('2021-02-30') 보정
+    raw_dates = [r[0] for r in c.execute("SELECT DISTINCT reg_date FROM vehicle_data WHERE reg_month IS NOT NULL").fetchall()]
+    updates = [(iso, month, raw) for raw in raw_dates for iso, month in [normalize_reg_date(raw)] if iso != raw]
+    c.executemany("UPDATE vehicle_data SET reg_date = ?, reg_month = ? WHERE reg_date = ?", updates)
+
+def _m013_unknown_yard_addresses(c):
+    # 자동 등록 폐차장의 자리표시 주소가 '주소, Korea' 로 번역되어 저장된 행 → NULL
+    c.execute("UPDATE junkyard_info SET address_en = NULL, address_ru = NULL, address_ar = NULL, region_code = '' WHERE address = '주소 미등록'")
+
+INVENTORY_MIGRATIONS = [
+    (1, 'inventory base schema', _m001_inventory_base),
+    (2, 'vehicle_data filter indexes', _m002_vehicle_indexes),
+    (3, 'normalized reg_date and reg_month', _m003_reg_month),
+    (4, 'keyset pagination indexes', _m004_keyset_indexes),
+    (5, 'vehicle full-text index', _m005_vehicle_fts),
+    (6, 'facet count tables', _m006_facet_tables),
+    (7, 'junkyard multilingual address columns', _m007_junkyard_i18n),
+    (8, 'vehicle_photos table and photo_count', _m008_vehicle_photos),
+    (9, 'photo rendition paths', _m009_photo_renditions),
+    (10, 'content-addressed photo blobs', _m010_photo_blobs),
+    (11, 'normalizer rules version', _m011_norm_version),
+    (12, 'fix invalid reg_date values', _m012_fix_reg_dates),
+    (13, 'clear translated placeholder yard addresses', _m013_unknown_yard_addresses),
+]
+
+# --- system.db ---
+def _m001_system_base(c):
     c.execute('''CREATE TABLE IF NOT EXISTS users (
         user_id TEXT PRIMARY KEY, password TEXT, name TEXT, company TEXT, 
         country TEXT, email TEXT, phone TEXT, role TEXT DEFAULT 'buyer', 
@@ -104,7 +531,47 @@ def init_dbs():
     c.execute('''CREATE TABLE IF NOT EXISTS search_logs_v2 (
         id INTEGER PRIMARY KEY AUTOINCREMENT, keyword TEXT, search_type TEXT, 
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-    
+
+def _m002_email_outbox(c):
+    # 메일 발송함: 요청 스레드는 행만 추가, 발송은 백그라운드 스레드 (status: pending → sent / failed)
+    c.execute('''CREATE TABLE IF NOT EXISTS email_outbox (
+        id INTEGER PRIMARY KEY, to_addr TEXT NOT NULL, subject TEXT, body TEXT, attachments TEXT DEFAULT '[]',
+        batch_key TEXT, status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0, last_error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, sent_at TIMESTAMP)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON email_outbox (status, next_attempt_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_batch ON email_outbox (batch_key, to_addr) WHERE status = 'pending'")
+
+def _m003_order_indexes(c):
+    # 주문함 조회 범위(관리자 전체 / 파트너 / 바이어) × 상태 필터별로 (created_at, id) 역순 키셋 페이지
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status, created_at, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_partner ON orders (real_junkyard_name, created_at, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_partner_status ON orders (real_junkyard_name, status, created_at, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_buyer ON orders (buyer_id, created_at, id)")
+    c.execute("ANALYZE orders")
+
+def _m004_search_demand(c):
+    # 검색 로그 상세 컬럼 + 시간/일 단위 수요 집계 (로그 기록 스레드가 배치마다 증분 갱신)
+    cols = _table_columns(c, 'search_logs_v2')
+    for col, ddl in [('user_id', 'TEXT'), ('country', 'TEXT'), ('manufacturer', 'TEXT'), ('models', 'TEXT'),
+                     ('engines', 'TEXT'), ('result_count', 'INTEGER')]:
+        if col not in cols: c.execute(f"ALTER TABLE search_logs_v2 ADD COLUMN {col} {ddl}")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_search_logs_created ON search_logs_v2 (created_at)")
+    for table in ['demand_hourly', 'demand_daily']:
+        c.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+            bucket TEXT NOT NULL, dim TEXT NOT NULL, value TEXT NOT NULL, cnt INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, dim, value)) WITHOUT ROWID''')
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_dim ON {table} (dim, bucket)")
+
+SYSTEM_MIGRATIONS = [
+    (1, 'system base schema', _m001_system_base),
+    (2, 'email outbox', _m002_email_outbox),
+    (3, 'order inbox indexes', _m003_order_indexes),
+    (4, 'search demand rollups', _m004_search_demand),
+]
+
+def _seed_system(c):
     c.execute("DROP TABLE IF EXISTS translations")
     c.execute('''CREATE TABLE translations (
         key TEXT PRIMARY KEY, English TEXT, Korean TEXT, Russian TEXT, Arabic TEXT)''')
@@ -120,38 +587,35 @@ def init_dbs():
         c.executemany("INSERT INTO translations VALUES (?, ?, ?, ?, ?)", data_to_insert)
 
     if not c.execute("SELECT * FROM users WHERE user_id = 'admin'").fetchone():
-        try: admin_hash = stauth.Hasher(['1234']).generate()[0]
-        except: admin_hash = stauth.Hasher().hash('1234')
         c.execute("INSERT INTO users (user_id, password, name, role, company) VALUES (?, ?, ?, ?, ?)", 
-                  ('admin', admin_hash, 'Administrator', 'admin', 'AdminHQ'))
-    conn.commit()
-    conn.close()
+                  ('admin', default_password_hash(), 'Administrator', 'admin', 'AdminHQ'))
 
 # ---------------------------------------------------------
 # 파일 처리 및 표준화
 # ---------------------------------------------------------
 def normalize_row(row):
-    raw_mfr = str(row.get('manufacturer', '')).strip()
-    raw_model = str(row.get('model_name', '')).strip()
-    std_mfr = BRAND_MAP.get(raw_mfr, raw_mfr)
-    if std_mfr == '현대': std_mfr = 'Hyundai' 
-    clean_model = re.sub(BRAND_REMOVE_REGEX, "", raw_model, flags=re.IGNORECASE).strip()
-    if clean_model.upper() in GARBAGE_TERMS: clean_model = "Unknown" 
-    std_model = clean_model
-    std_detail = ""
-    mapped = False
-    for k, v in MODEL_MAP.items():
-        if clean_model.upper() == k.upper() or clean_model.upper().startswith(k.upper()):
-            std_model = v
-            if clean_model.upper() == k.upper(): std_detail = ""
-            else:
-                det = re.sub(k, "", clean_model, flags=re.IGNORECASE).strip()
-                std_detail = det if det else ""
-            mapped = True
-            break
-    std_detail = std_detail.replace("(", "").replace(")", "").strip()
-    if std_model.upper() in GARBAGE_TERMS: std_model = "Unknown"
-    return std_mfr, std_model, std_detail
+    return NORMALIZER.normalize(str(row.get('manufacturer', '')), str(row.get('model_name', '')))
+
+REG_DATE_REGEX = re.compile(r"^\s*(\d{4})[.\-/년\s]*(\d{1,2})[.\-/월\s]*(\d{1,2})?")
+
+def normalize_reg_date(val):
+    # '2024.07.15', '20240715', '2024-7-5 00:00:00' 등 → ('2024-07-15', 202407)
+    raw = str(val).strip() if val is not None else ''
+    m = REG_DATE_REGEX.match(raw)
+    if not m: return raw, None
+    y, mo, d = int(m.group(1)), int(m.group(2)), int(m.group(3) or 1)
+    if not (1900 <= y <= 2100 and 1 <= mo <= 12 and 1 <= d <= 31): return raw, None
+    # 달력에 없는 날짜('2024.02.30')는 월은 살리고 일자만 그 달 말일로 맞춤
+    try: datetime.date(y, mo, d)
+    except ValueError: d = calendar.monthrange(y, mo)[1]
+    return f"{y:04d}-{mo:02d}-{d:02d}", y * 100 + mo
+
+def month_to_int(ym):
+    # 'YYYY-MM' ↔ YYYYMM
+    return int(str(ym).replace('-', '')[:6])
+
+def int_to_month(m):
+    return f"{int(m) // 100:04d}-{int(m) % 100:02d}"
 
 def read_file_smart(uploaded_file, header=None):
     file_ext = uploaded_file.name.split('.')[-1].lower()
@@ -172,69 +636,138 @@ def read_file_smart(uploaded_file, header=None):
             return pd.read_csv(io.BytesIO(file_bytes), header=header, dtype=str)
         except: return None
 
+# 재고 파일 헤더 별칭 (앞쪽이 우선)
+VEHICLE_COLUMN_ALIASES = {
+    'manufacturer': ['제조사', 'Manufacturer'],
+    'model_name': ['차량명', 'Model'],
+    'reg_date': ['등록일자', 'RegDate'],
+    'car_no': ['차량번호', 'CarNo'],
+    'junkyard': ['회원사', 'Junkyard', 'Company'],
+    'engine_code': ['원동기형식', 'Engine'],
+    'model_year': ['연식', 'Year'],
+}
+VEHICLE_ROW_FIELDS = ['vin', 'reg_date', 'car_no', 'manufacturer', 'model_name', 'model_detail', 'model_year', 'junkyard', 'engine_code', 'reg_month']
+VEHICLE_HEADER_KEYWORDS = ['차대번호', 'vin', '차량번호', 'car_no', '등록일자']
+
+def find_header_row(df, keywords=VEHICLE_HEADER_KEYWORDS, limit=20):
+    for i, row in df.head(limit).iterrows():
+        row_str = " ".join([str(x).lower() for x in row.values])
+        if any(k in row_str for k in keywords):
+            return i
+    return 0
+
+def resolve_vehicle_columns(columns):
+    # 헤더 별칭을 파일당 한 번만 해석 → {필드: 실제 컬럼명 or None}, VIN 컬럼 없으면 None
+    columns = [str(c).strip() for c in columns]
+    vin_col = next((c for c in columns if '차대번호' in c or 'VIN' in c or 'vin' in c), None)
+    if not vin_col: return None
+    cols = {field: next((a for a in aliases if a in columns), None) for field, aliases in VEHICLE_COLUMN_ALIASES.items()}
+    cols['vin'] = vin_col
+    return cols
+
+def _text_col(df, col):
+    if col is None: return pd.Series('', index=df.index, dtype=object)
+    return df[col].fillna('').astype(str).str.strip()
+
+def normalize_reg_dates(series):
+    # 고유 등록일자 값만 파싱 → (ISO 날짜 Series, YYYYMM Series[object, 없으면 None])
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    parsed = [normalize_reg_date(u) for u in uniques]
+    iso = np.array([p[0] for p in parsed], dtype=object)
+    month = np.array([p[1] for p in parsed], dtype=object)
+    return pd.Series(iso[codes], index=series.index), pd.Series(month[codes], index=series.index)
+
+def parse_vehicle_frame(df, cols):
+    # 컬럼 단위 벡터 처리 → executemany용 튜플 리스트 (vehicle_data 컬럼 순서: VEHICLE_ROW_FIELDS)
+    if df.empty: return []
+    vin = _text_col(df, cols['vin'])
+    keep = vin.str.len() >= 5
+    if not keep.any(): return []
+    df, vin = df[keep], vin[keep]
+
+    std_mfr, std_mod, std_det = NORMALIZER.normalize_series(_text_col(df, cols['manufacturer']), _text_col(df, cols['model_name']))
+    reg, reg_month = normalize_reg_dates(_text_col(df, cols['reg_date']))
+    if cols['model_year'] is None:
+        year = pd.Series(0.0, index=df.index)
+    else:
+        year = pd.to_numeric(_text_col(df, cols['model_year']).str.extract(r"([\d\.]+)", expand=False), errors='coerce').fillna(0.0)
+
+    return list(zip(vin.tolist(), reg.tolist(), _text_col(df, cols['car_no']).tolist(),
+                    std_mfr.tolist(), std_mod.tolist(), std_det.tolist(), year.astype(float).tolist(),
+                    _text_col(df, cols['junkyard']).tolist(), _text_col(df, cols['engine_code']).tolist(),
+                    reg_month.tolist()))
+
+_rules_version = {}
+
+def rules_version():
+    # 현재 NORMALIZER 규칙의 버전 번호 (지문이 최신 버전과 다르면 새 버전 등록, 프로세스당 1회)
+    if NORMALIZER.digest in _rules_version: return _rules_version[NORMALIZER.digest]
+    with write_conn(INVENTORY_DB) as conn:
+        row = conn.execute("SELECT version, digest FROM normalizer_rules ORDER BY version DESC LIMIT 1").fetchone()
+        if row and row[1] == NORMALIZER.digest: version = row[0]
+        else: version = conn.execute("INSERT INTO normalizer_rules (digest) VALUES (?)", (NORMALIZER.digest,)).lastrowid
+    _rules_version[NORMALIZER.digest] = version
+    return version
+
+def write_vehicle_rows(db_rows, analyze=True):
+    # 임시 스테이징 테이블 → 변경 없는 행 제거 → 원본 컬럼만 UPSERT (파트너가 입력한 price/mileage/photos 보존)
+    # model_list / junkyard_info 는 변경분(스테이징)에서만 갱신
+    # 반환: 새로 들어가거나 바뀐 행 수 (같은 파일 재업로드 → 0)
+    if not db_rows: return 0
+    version = rules_version()
+    fields = ', '.join(VEHICLE_ROW_FIELDS)
+    src_cols = [f for f in VEHICLE_ROW_FIELDS if f != 'vin']
+    with write_conn(INVENTORY_DB) as conn:
+        c = conn.cursor()
+        c.execute(f"CREATE TEMP TABLE IF NOT EXISTS vehicle_stage ({', '.join(f + ' PRIMARY KEY' if f == 'vin' else f for f in VEHICLE_ROW_FIELDS)})")
+        c.execute("DELETE FROM vehicle_stage")
+        c.executemany(f"INSERT OR REPLACE INTO vehicle_stage ({fields}) VALUES ({', '.join(['?'] * len(VEHICLE_ROW_FIELDS))})", db_rows)
+        c.execute(f'''DELETE FROM vehicle_stage WHERE EXISTS (
+                          SELECT 1 FROM vehicle_data v WHERE v.vin = vehicle_stage.vin
+                          AND {' AND '.join(f'v.{f} IS vehicle_stage.{f}' for f in src_cols)})''')
+        changed = c.execute("SELECT COUNT(*) FROM vehicle_stage").fetchone()[0]
+        if changed:
+            # 적재 시점 규칙으로 표준화된 행 → 현재 규칙 버전 기록
+            c.execute(f'''INSERT INTO vehicle_data ({fields}, norm_version) SELECT {fields}, ? FROM vehicle_stage WHERE true
+                          ON CONFLICT(vin) DO UPDATE SET {', '.join(f'{f} = excluded.{f}' for f in src_cols)}, norm_version = excluded.norm_version''',
+                      (version,))
+            c.execute("INSERT OR IGNORE INTO model_list (manufacturer, model_name) SELECT DISTINCT manufacturer, model_name FROM vehicle_stage")
+            yards = [r[0] for r in c.execute("SELECT DISTINCT junkyard FROM vehicle_stage WHERE length(junkyard) > 1").fetchall()]
+            unknown = (UNKNOWN_ADDRESS, '기타') + junkyard_address_fields(UNKNOWN_ADDRESS)
+            c.executemany("""INSERT OR IGNORE INTO junkyard_info (name, address, region, address_en, address_ru, address_ar, region_code)
+                             VALUES (?, ?, ?, ?, ?, ?, ?)""", [(y,) + unknown for y in yards])
+            if analyze: analyze_inventory(conn)
+        else: yards = []
+        c.execute("DELETE FROM vehicle_stage")
+    if changed: bump_generation('inventory')
+    
+    if yards:
+        with write_conn(SYSTEM_DB) as conn_sys:
+            new_yards = [y for y in yards if not conn_sys.execute("SELECT 1 FROM users WHERE user_id = ?", (y,)).fetchone()]
+            if new_yards:
+                pw = default_password_hash()
+                conn_sys.executemany("INSERT INTO users (user_id, password, name, company, role) VALUES (?, ?, ?, ?, ?)", [(y, pw, y, y, 'partner') for y in new_yards])
+        if new_yards: bump_generation('users')
+    return changed
+
+def parse_vehicle_file(uploaded_file):
+    df = read_file_smart(uploaded_file, header=None)
+    if df is None: return []
+    
+    header_idx = find_header_row(df)
+    df.columns = [str(c).strip() for c in df.iloc[header_idx]]
+    df = df.iloc[header_idx+1:]
+    df = df.loc[:, ~df.columns.duplicated()]
+    
+    cols = resolve_vehicle_columns(df.columns)
+    if not cols: return []
+    return parse_vehicle_frame(df, cols)
+
 def save_vehicle_file(uploaded_file):
     try:
-        df = read_file_smart(uploaded_file, header=None)
-        if df is None: return 0
-        
-        header_idx = -1
-        target_keywords = ['차대번호', 'vin', '차량번호', 'car_no', '등록일자']
-        for i, row in df.head(20).iterrows():
-            row_str = " ".join([str(x).lower() for x in row.values])
-            if any(k in row_str for k in target_keywords):
-                header_idx = i
-                break
-        
-        if header_idx == -1: header_idx = 0
-        df.columns = df.iloc[header_idx]
-        df = df.iloc[header_idx+1:]
-        df.columns = [str(c).strip() for c in df.columns]
-        
-        vin_col = next((c for c in df.columns if '차대번호' in c or 'VIN' in c or 'vin' in c), None)
-        if not vin_col: return 0
-        
-        db_rows = []
-        for _, row in df.iterrows():
-            mfr = str(row.get('제조사', row.get('Manufacturer', ''))).strip()
-            mod = str(row.get('차량명', row.get('Model', ''))).strip()
-            std_mfr, std_mod, std_det = normalize_row({'manufacturer': mfr, 'model_name': mod})
-            
-            vin = str(row.get(vin_col, '')).strip()
-            reg = str(row.get('등록일자', row.get('RegDate', ''))).strip()
-            no = str(row.get('차량번호', row.get('CarNo', ''))).strip()
-            yard = str(row.get('회원사', row.get('Junkyard', row.get('Company', '')))).strip()
-            eng = str(row.get('원동기형식', row.get('Engine', ''))).strip()
-            
-            year_val = row.get('연식', row.get('Year', 0))
-            try: year = float(re.findall(r"[\d\.]+", str(year_val))[0])
-            except: year = 0.0
-            
-            if len(vin) < 5: continue
-            db_rows.append((vin, reg, no, std_mfr, std_mod, std_det, year, yard, eng))
-            
-        conn = sqlite3.connect(INVENTORY_DB)
-        c = conn.cursor()
-        c.executemany('''INSERT OR REPLACE INTO vehicle_data 
-                         (vin, reg_date, car_no, manufacturer, model_name, model_detail, model_year, junkyard, engine_code) 
-                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', db_rows)
-        c.execute("INSERT OR IGNORE INTO model_list (manufacturer, model_name) SELECT DISTINCT manufacturer, model_name FROM vehicle_data")
-        
-        yards = set([r[7] for r in db_rows if r[7] and len(r[7]) > 1])
-        for y in yards:
-            c.execute("INSERT OR IGNORE INTO junkyard_info (name, address, region) VALUES (?, ?, ?)", (y, '주소 미등록', '기타'))
-        conn.commit()
-        conn.close()
-        
-        conn_sys = sqlite3.connect(SYSTEM_DB)
-        try: pw = stauth.Hasher(['1234']).generate()[0]
-        except: pw = stauth.Hasher().hash('1234')
-        for y in yards:
-            if not conn_sys.execute("SELECT * FROM users WHERE user_id = ?", (y,)).fetchone():
-                conn_sys.execute("INSERT INTO users (user_id, password, name, company, role) VALUES (?, ?, ?, ?, ?)", (y, pw, y, y, 'partner'))
-        conn_sys.commit()
-        conn_sys.close()
-        
-        return len(db_rows)
+        db_rows = parse_vehicle_file(uploaded_file)
+        if not db_rows: return 0
+        return write_vehicle_rows(db_rows)
     except Exception as e:
         print(f"File Save Error: {e}")
         return 0
@@ -259,186 +792,741 @@ def save_address_file(uploaded_file):
         
         if not name_col: return 0
         
-        conn = sqlite3.connect(INVENTORY_DB)
-        cnt = 0
+        rows = []
         for _, r in df.iterrows():
             nm = str(r[name_col]).strip()
             ad = str(r[addr_col]).strip() if addr_col else ''
             reg = ad[:2] if len(ad) >= 2 else '기타'
-            if nm:
-                conn.execute("INSERT OR REPLACE INTO junkyard_info (name, address, region) VALUES (?, ?, ?)", (nm, ad, reg))
-                cnt += 1
-        conn.commit()
-        conn.close()
-        return cnt
+            if nm: rows.append((nm, ad, reg) + junkyard_address_fields(ad))
+        with write_conn(INVENTORY_DB) as conn:
+            conn.executemany("""INSERT OR REPLACE INTO junkyard_info (name, address, region, address_en, address_ru, address_ar, region_code)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)""", rows)
+        bump_generation('inventory')
+        return len(rows)
     except: return 0
 
+# ---------------------------------------------------------
+# 스트리밍 적재 (대용량 파일: 청크 단위 파싱 → 청크별 트랜잭션)
+# ---------------------------------------------------------
+STREAM_CHUNK_ROWS = 50000
+
+def _file_size(f):
+    pos = f.tell()
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(pos)
+    return size
+
+def _sniff_csv_encoding(f, sample_size=1 << 16):
+    # 앞부분만 읽어 UTF-8 여부 판단 (잘린 멀티바이트 문자는 허용), 실패 시 cp949
+    f.seek(0)
+    sample = f.read(sample_size)
+    f.seek(0)
+    try:
+        codecs.getincrementaldecoder('utf-8-sig')().decode(sample, final=False)
+        return 'utf-8-sig'
+    except UnicodeDecodeError:
+        return 'cp949'
+
+def _cell_str(v):
+    if v is None: return None
+    if isinstance(v, float) and v.is_integer(): return str(int(v))
+    return str(v)
+
+def _iter_xlsx_chunks(f, chunk_rows):
+    from openpyxl import load_workbook
+    wb = load_workbook(f, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        total, done, buf = ws.max_row or 0, 0, []
+        for row in ws.iter_rows(values_only=True):
+            buf.append([_cell_str(v) for v in row])
+            if len(buf) >= chunk_rows:
+                done += len(buf)
+                yield pd.DataFrame(buf, dtype=object), (done / total if total else None)
+                buf = []
+        if buf: yield pd.DataFrame(buf, dtype=object), 1.0
+    finally:
+        wb.close()
+
+def iter_file_chunks(uploaded_file, chunk_rows=STREAM_CHUNK_ROWS):
+    # (header=None 원시 청크, 진행률 0~1 또는 None) 제너레이터
+    file_ext = uploaded_file.name.split('.')[-1].lower()
+    uploaded_file.seek(0)
+    
+    if file_ext == 'csv' or 'csv' in str(getattr(uploaded_file, 'type', '')):
+        size = _file_size(uploaded_file)
+        enc, done = _sniff_csv_encoding(uploaded_file), 0
+        try:
+            for chunk in pd.read_csv(uploaded_file, header=None, dtype=str, encoding=enc, chunksize=chunk_rows):
+                done += len(chunk)
+                yield chunk, (min(1.0, uploaded_file.tell() / size) if size else None)
+        except UnicodeDecodeError:
+            if enc == 'cp949': raise
+            # 앞부분 샘플이 ASCII 뿐인 cp949 파일: 이미 넘긴 행 다음부터 cp949 로 다시 읽음
+            uploaded_file.seek(0)
+            for chunk in pd.read_csv(uploaded_file, header=None, dtype=str, encoding='cp949', chunksize=chunk_rows, skiprows=done):
+                chunk.index += done
+                yield chunk, (min(1.0, uploaded_file.tell() / size) if size else None)
+        return
+    if file_ext in ('xlsx', 'xlsm'):
+        try:
+            yield from _iter_xlsx_chunks(uploaded_file, chunk_rows)
+            return
+        except GeneratorExit: raise
+        except Exception as e:
+            print(f"Stream read fallback ({uploaded_file.name}): {e}")
+    # xls 등 스트리밍 불가 포맷: 전체 읽은 뒤 청크로 분할
+    df = read_file_smart(uploaded_file, header=None)
+    if df is None: return
+    for i in range(0, len(df), chunk_rows):
+        yield df.iloc[i:i + chunk_rows], min(1.0, (i + chunk_rows) / len(df))
+
+def save_vehicle_file_stream(uploaded_file, progress=None, chunk_rows=STREAM_CHUNK_ROWS):
+    # 청크마다 파싱·표준화·저장을 끝내고 버리므로 메모리는 파일 크기와 무관하게 일정
+    # progress(읽은 행 수, 진행률 0~1 또는 None)
+    # 결과는 병렬 적재와 같은 {'file', 'rows'(읽은 행), 'changed'(신규+변경), 'error'}
+    # 중간 실패 시 앞 청크는 이미 저장됨 → error 에 부분 적재 표시
+    cols, columns, saved, changed = None, None, 0, 0
+    res = {'file': uploaded_file.name, 'rows': 0, 'changed': 0, 'error': None}
+    try:
+        for chunk, frac in iter_file_chunks(uploaded_file, chunk_rows):
+            if columns is None:
+                header_idx = find_header_row(chunk)
+                columns = [str(c).strip() for c in chunk.iloc[header_idx]]
+                chunk = chunk.iloc[header_idx+1:]
+                cols = resolve_vehicle_columns(columns)
+                if not cols: return dict(res, error="No vehicle rows found (VIN column missing?)")
+            chunk = chunk.reindex(columns=range(len(columns)))
+            chunk.columns = columns
+            chunk = chunk.loc[:, ~chunk.columns.duplicated()]
+            db_rows = parse_vehicle_frame(chunk, cols)
+            changed += write_vehicle_rows(db_rows, analyze=False)
+            saved += len(db_rows)
+            if progress: progress(saved, frac)
+    except Exception as e:
+        print(f"File Stream Save Error: {e}")
+        res['error'] = f"Partially imported ({saved:,} rows saved before the error): {e}" if saved else str(e)
+    if changed:
+        with write_conn(INVENTORY_DB) as conn:
+            analyze_inventory(conn)
+    if not saved and not res['error']: res['error'] = "No vehicle rows found (VIN column missing?)"
+    return dict(res, rows=saved, changed=changed)
+
+# ---------------------------------------------------------
+# 병렬 적재 (여러 파일: 프로세스 풀에서 파싱·표준화 → 부모 프로세스 단일 writer로 저장)
+# ---------------------------------------------------------
+class _NamedBuffer(io.BytesIO):
+    def __init__(self, data, name, type=''):
+        super().__init__(data)
+        self.name, self.type = name, type
+
+def parse_vehicle_bytes(name, ftype, data):
+    # 워커 프로세스용 (피클 가능한 인자만 받음) → (파일명, 행 튜플 리스트, 오류 메시지)
+    try:
+        return name, parse_vehicle_file(_NamedBuffer(data, name, ftype)), None
+    except Exception as e:
+        return name, [], str(e)
+
+def save_vehicle_files_parallel(uploaded_files, max_workers=None, progress=None):
+    # 파일별 결과 [{'file', 'rows', 'changed', 'error'}] 반환, progress(완료 파일 수, 전체 파일 수, 결과 dict)
+    results = []
+    if not uploaded_files: return results
+    workers = max_workers or min(len(uploaded_files), os.cpu_count() or 1)
+    # Streamlit 서버는 멀티스레드이므로 fork 대신 spawn
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as ex:
+        futures = {}
+        for f in uploaded_files:
+            f.seek(0)
+            futures[ex.submit(parse_vehicle_bytes, f.name, getattr(f, 'type', ''), f.read())] = f.name
+        for fut in as_completed(futures):
+            name = futures[fut]
+            try:
+                _, db_rows, err = fut.result()
+                saved, changed = len(db_rows), (write_vehicle_rows(db_rows, analyze=False) if db_rows else 0)
+            except Exception as e:
+                saved, changed, err = 0, 0, str(e)
+            if not saved and not err: err = "No vehicle rows found (VIN column missing?)"
+            res = {'file': name, 'rows': saved, 'changed': changed, 'error': err}
+            results.append(res)
+            if progress: progress(len(results), len(uploaded_files), res)
+    if any(r['changed'] for r in results):
+        with write_conn(INVENTORY_DB) as conn:
+            analyze_inventory(conn)
+    return results
+
 def get_all_junkyards():
-    conn = sqlite3.connect(INVENTORY_DB)
-    df = pd.read_sql("SELECT * FROM junkyard_info", conn)
-    conn.close()
-    return df
+    with read_conn(INVENTORY_DB) as conn:
+        return pd.read_sql("SELECT * FROM junkyard_info", conn)
 
 # ---------------------------------------------------------
 # 사용자 관리
 # ---------------------------------------------------------
+@lru_cache(maxsize=1)
+def default_password_hash():
+    # 기본 비밀번호('1234') bcrypt 해시는 프로세스당 1회만 계산
+    try: return stauth.Hasher(['1234']).generate()[0]
+    except: return stauth.Hasher().hash('1234')
+
+# 인증용 사용자 스냅샷: users 세대(generation)가 바뀔 때만 다시 읽음
+_auth_lock = threading.Lock()
+_auth_snapshot = {'generation': None, 'usernames': None}
+
+def _load_auth_users():
+    usernames = {'admin': {'name': 'Administrator', 'password': default_password_hash(), 'role': 'admin', 'email': '', 'phone': '', 'company': 'AdminHQ'}}
+    with read_conn(SYSTEM_DB) as conn:
+        rows = conn.execute("SELECT user_id, password, name, role, email, phone, company FROM users").fetchall()
+    for r in rows:
+        usernames[r[0]] = {
+            'name': r[2], 
+            'password': r[1], 
+            'role': r[3], 
+            'email': r[4] or '', 
+            'phone': r[5] or '',
+            'company': r[6] or ''
+        }
+    return usernames
+
 def fetch_users_for_auth():
-    try: admin_pw = stauth.Hasher(['1234']).generate()[0]
-    except: admin_pw = stauth.Hasher().hash('1234')
-    
-    creds = {'usernames': {'admin': {'name': 'Administrator', 'password': admin_pw, 'role': 'admin', 'email': '', 'phone': '', 'company': 'AdminHQ'}}}
-    
-    try:
-        conn = sqlite3.connect(SYSTEM_DB)
-        for r in conn.execute("SELECT user_id, password, name, role, email, phone, company FROM users").fetchall():
-            creds['usernames'][r[0]] = {
-                'name': r[2], 
-                'password': r[1], 
-                'role': r[3], 
-                'email': r[4] or '', 
-                'phone': r[5] or '',
-                'company': r[6] or ''
-            }
-        conn.close()
-    except: pass
-    return creds
+    gen = get_generation('users')
+    if _auth_snapshot['generation'] != gen:
+        with _auth_lock:
+            if _auth_snapshot['generation'] != gen:
+                try:
+                    _auth_snapshot.update({'usernames': _load_auth_users(), 'generation': gen})
+                except:
+                    if _auth_snapshot['usernames'] is None:
+                        return {'usernames': {'admin': {'name': 'Administrator', 'password': default_password_hash(), 'role': 'admin', 'email': '', 'phone': '', 'company': 'AdminHQ'}}}
+    # stauth.Authenticate가 사용자 dict를 수정할 수 있으므로 세션마다 얕은 복사본 전달
+    return {'usernames': {k: dict(v) for k, v in _auth_snapshot['usernames'].items()}}
 
 def create_user(uid, pw, name, comp, country, email, phone):
     try:
-        conn = sqlite3.connect(SYSTEM_DB)
         try: hpw = stauth.Hasher([pw]).generate()[0]
         except: hpw = stauth.Hasher().hash(pw)
-        conn.execute("INSERT INTO users (user_id, password, name, company, country, email, phone, role) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", 
-                     (uid, hpw, name, comp, country, email, phone, 'buyer'))
-        conn.commit()
-        conn.close()
+        with write_conn(SYSTEM_DB) as conn:
+            conn.execute("INSERT INTO users (user_id, password, name, company, country, email, phone, role) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", 
+                         (uid, hpw, name, comp, country, email, phone, 'buyer'))
+        bump_generation('users')
         return True
     except: return False
 
 def create_user_bulk(user_data_list):
-    conn = sqlite3.connect(SYSTEM_DB)
-    c = conn.cursor()
     success_count, fail_count = 0, 0
-    try: default_pw = stauth.Hasher(['1234']).generate()[0]
-    except: default_pw = stauth.Hasher().hash('1234')
+    default_pw = default_password_hash()
 
-    for user in user_data_list:
-        try:
-            email = user.get('email', '')
-            if not email: 
-                fail_count += 1
-                continue
-            c.execute('''INSERT INTO users (user_id, password, name, company, country, email, phone, role) 
-                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', 
-                      (email, default_pw, user.get('name', 'User'), 
-                       user.get('company', ''), user.get('country', ''), 
-                       email, str(user.get('phone', '')), 'buyer'))
-            success_count += 1
-        except: fail_count += 1
-    conn.commit()
-    conn.close()
+    with write_conn(SYSTEM_DB) as conn:
+        c = conn.cursor()
+        for user in user_data_list:
+            try:
+                email = user.get('email', '')
+                if not email: 
+                    fail_count += 1
+                    continue
+                c.execute('''INSERT INTO users (user_id, password, name, company, country, email, phone, role) 
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', 
+                          (email, default_pw, user.get('name', 'User'), 
+                           user.get('company', ''), user.get('country', ''), 
+                           email, str(user.get('phone', '')), 'buyer'))
+                success_count += 1
+            except: fail_count += 1
+    bump_generation('users')
     return success_count, fail_count
 
 def update_user_role(uid, role):
-    conn = sqlite3.connect(SYSTEM_DB)
-    conn.execute("UPDATE users SET role = ? WHERE user_id = ?", (role, uid))
-    conn.commit()
-    conn.close()
+    with write_conn(SYSTEM_DB) as conn:
+        conn.execute("UPDATE users SET role = ? WHERE user_id = ?", (role, uid))
+    bump_generation('users')
 
 def update_user_info(uid, email, phone):
-    conn = sqlite3.connect(SYSTEM_DB)
-    conn.execute("UPDATE users SET email = ?, phone = ? WHERE user_id = ?", (email, phone, uid))
-    conn.commit()
-    conn.close()
+    with write_conn(SYSTEM_DB) as conn:
+        conn.execute("UPDATE users SET email = ?, phone = ? WHERE user_id = ?", (email, phone, uid))
+    bump_generation('users')
 
 def delete_user(uid):
-    conn = sqlite3.connect(SYSTEM_DB)
-    conn.execute("DELETE FROM users WHERE user_id = ?", (uid,))
-    conn.commit()
-    conn.close()
+    with write_conn(SYSTEM_DB) as conn:
+        conn.execute("DELETE FROM users WHERE user_id = ?", (uid,))
+    bump_generation('users')
 
 def fetch_all_users():
-    conn = sqlite3.connect(SYSTEM_DB)
-    df = pd.read_sql("SELECT * FROM users", conn)
-    conn.close()
-    return df
+    with read_conn(SYSTEM_DB) as conn:
+        return pd.read_sql("SELECT * FROM users", conn)
 
 # ---------------------------------------------------------
 # 데이터 검색 및 주문 관리
 # ---------------------------------------------------------
-@st.cache_data(ttl=60)
-def search_data(maker, models, details, engines, sy, ey, yards, sm, em, only_photo=False, only_price=False):
-    try:
-        conn = sqlite3.connect(INVENTORY_DB)
-        cond, params = "1=1", []
+PAGE_SIZE = 200
+
+def build_fts_query(text):
+    # 'sorento 2.2' → '"sorento"* "2.2"*' (모든 토큰 AND, 접두어 검색)
+    tokens = [tok.replace('"', '""') for tok in str(text or '').split() if re.search(r"\w", tok)]
+    return " ".join(f'"{tok}"*' for tok in tokens)
+
+FTS_BROAD_LIMIT = 2000
+
+def fts_is_broad(conn, fts_q):
+    # 매칭 건수가 많으면 (FTS → 정렬) 대신 정렬 인덱스 순서로 훑으며 FTS 결과로 거르는 편이 빠름
+    n = conn.execute("SELECT COUNT(*) FROM (SELECT rowid FROM vehicle_fts WHERE vehicle_fts MATCH ? LIMIT ?)", (fts_q, FTS_BROAD_LIMIT)).fetchone()[0]
+    return n >= FTS_BROAD_LIMIT
+
+def build_search_filter(maker, models, details, engines, sy, ey, yards, sm, em, only_photo=False, only_price=False, text='', fts_ordered_scan=False):
+    cond, params = "1=1", []
+    
+    fts_q = build_fts_query(text)
+    if fts_q:
+        # '+v.rowid': rowid 조회 대신 정렬 인덱스를 쓰도록 플래너 유도
+        cond += f" AND {'+' if fts_ordered_scan else ''}v.rowid IN (SELECT rowid FROM vehicle_fts WHERE vehicle_fts MATCH ?)"; params.append(fts_q)
+    
+    if maker and maker != "All":
+        cond += " AND v.manufacturer = ?"; params.append(maker)
+    cond += " AND v.model_year >= ? AND v.model_year <= ?"; params.extend([sy, ey])
+    cond += " AND v.reg_month BETWEEN ? AND ?"; params.extend([month_to_int(sm), month_to_int(em)])
+    if models:
+        cond += f" AND v.model_name IN ({','.join(['?']*len(models))})"; params.extend(models)
+    if details:
+        cond += f" AND v.model_detail IN ({','.join(['?']*len(details))})"; params.extend(details)
+    if engines:
+        cond += f" AND v.engine_code IN ({','.join(['?']*len(engines))})"; params.extend(engines)
+    if yards:
+        cond += f" AND v.junkyard IN ({','.join(['?']*len(yards))})"; params.extend(yards)
+
+    if only_photo:
+        cond += " AND v.photo_count > 0"
+    if only_price:
+        cond += " AND v.price > 0"
+    return cond, params
+
+@inventory_cached
+def _count_data(maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text):
+    eng = columnar_engine()
+    if eng is not None:
+        return len(_columnar_select(eng, maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text))
+    cond, params = build_search_filter(maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text)
+    with read_conn(INVENTORY_DB) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM vehicle_data v WHERE {cond}", params).fetchone()[0]
+
+# 실패 결과는 캐시하지 않도록 예외 처리는 캐시 바깥에서
+def count_data(maker, models, details, engines, sy, ey, yards, sm, em, only_photo=False, only_price=False, text=''):
+    try: return _count_data(maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text)
+    except: return 0
+
+# ---------------------------------------------------------
+# 검색 패싯 카운트 (모델/세부모델/엔진코드/연식 구간/지역)
+# ---------------------------------------------------------
+# 모델·세부모델·엔진 필터를 뺀 조건의 후보를 한 번만 구함 → 각 패싯은 '자기 자신을 제외한' 나머지 선택으로 집계
+# (모델을 하나 골라도 다른 모델 후보의 개수가 0이 되지 않도록)
+# 컬럼형 엔진이 준비되어 있으면 후보 위치의 코드 배열을 bincount, 아니면 SQL GROUP BY
+YEAR_BUCKET = 5
+
+def year_bucket_label(b):
+    return f"{int(b)}-{int(b) + YEAR_BUCKET - 1}"
+
+# 지역 패싯은 시/도 코드(region_code) 기준, '' = 주소 미등록 → 화면에서 언어별 이름으로 표시
+@inventory_cached
+def _junkyard_regions():
+    with read_conn(INVENTORY_DB) as conn:
+        return dict(conn.execute("SELECT name, COALESCE(region_code, '') FROM junkyard_info").fetchall())
+
+def _columnar_facets(eng, maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text):
+    cands = _columnar_select(eng, maker, [], [], [], sy, ey, yards, sm, em, only_photo, only_price, text)
+    everything = np.ones(len(cands), dtype=bool)
+    in_model = eng.mask('model_name', cands, models) if models else everything
+    in_detail = eng.mask('model_detail', cands, details) if details else everything
+    in_engine = eng.mask('engine_code', cands, engines) if engines else everything
+    def _sorted(counts):
+        return {k: v for k, v in sorted(counts.items(), key=lambda x: -x[1]) if k not in (None, '')}
+    def _count(mask, col): return _sorted(eng.value_counts(col, cands[mask]))
+
+    matched = cands[in_model & in_detail & in_engine]
+    y = eng.year[matched]
+    buckets, cnt = np.unique(np.floor(y[~np.isnan(y)]) // YEAR_BUCKET * YEAR_BUCKET, return_counts=True)
+    regions, codes = {}, _junkyard_regions()
+    for name, n in eng.value_counts('junkyard', matched).items():
+        r = codes.get(name, '')
+        regions[r] = regions.get(r, 0) + n
+    nulls = len(matched) - sum(regions.values())
+    if nulls: regions[''] = regions.get('', 0) + nulls
+    return {
+        'model_name': _count(in_detail & in_engine, 'model_name'),
+        'model_detail': _count(in_model & in_engine, 'model_detail'),
+        'engine_code': _count(in_model & in_detail, 'engine_code'),
+        'year_bucket': {year_bucket_label(k): int(v) for k, v in zip(buckets[::-1], cnt[::-1]) if k > 0},
+        'region': dict(sorted(regions.items(), key=lambda x: -x[1])),
+    }
+
+@inventory_cached
+def _facet_counts(maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text):
+    eng = columnar_engine()
+    if eng is not None:
+        return _columnar_facets(eng, maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text)
+    cond, params = build_search_filter(maker, [], [], [], sy, ey, yards, sm, em, only_photo, only_price, text)
+    q = f'''SELECT v.model_name, v.model_detail, v.engine_code,
+                   CAST(v.model_year AS INTEGER) / {YEAR_BUCKET} * {YEAR_BUCKET} AS year_bucket,
+                   COALESCE(j.region_code, '') AS region, COUNT(*) AS cnt
+            FROM vehicle_data v LEFT JOIN junkyard_info j ON v.junkyard = j.name
+            WHERE {cond} GROUP BY 1, 2, 3, 4, 5'''
+    with read_conn(INVENTORY_DB) as conn:
+        g = pd.read_sql(q, conn, params=params)
+    in_model = g['model_name'].isin(models) if models else pd.Series(True, index=g.index)
+    in_detail = g['model_detail'].isin(details) if details else pd.Series(True, index=g.index)
+    in_engine = g['engine_code'].isin(engines) if engines else pd.Series(True, index=g.index)
+    def _count(mask, by):
+        s = g[mask].groupby(by)['cnt'].sum().sort_values(ascending=False)
+        return {k: int(v) for k, v in s.items() if k not in (None, '')}
+    years = g[in_model & in_detail & in_engine].groupby('year_bucket')['cnt'].sum().sort_index(ascending=False)
+    regions = g[in_model & in_detail & in_engine].groupby('region')['cnt'].sum().sort_values(ascending=False)
+    return {
+        'model_name': _count(in_detail & in_engine, 'model_name'),
+        'model_detail': _count(in_model & in_engine, 'model_detail'),
+        'engine_code': _count(in_model & in_detail, 'engine_code'),
+        'year_bucket': {year_bucket_label(k): int(v) for k, v in years.items() if k > 0},
+        'region': {k: int(v) for k, v in regions.items()},
+    }
+
+# search_data와 같은 인자 → {패싯: {값: 개수}} (실패 시 빈 dict)
+def facet_counts(maker, models, details, engines, sy, ey, yards, sm, em, only_photo=False, only_price=False, text=''):
+    try: return _facet_counts(maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text)
+    except: return {}
+
+# 검색 전(필터 없음) 라벨용: 패싯 테이블에서 바로 읽음
+@inventory_cached
+def facet_totals():
+    with read_conn(INVENTORY_DB) as conn:
+        models = conn.execute("SELECT model_name, SUM(cnt) FROM facet_model WHERE model_name != '' GROUP BY model_name").fetchall()
+        details = conn.execute("SELECT model_detail, SUM(cnt) FROM facet_model WHERE model_detail != '' GROUP BY model_detail").fetchall()
+        engines = conn.execute("SELECT engine_code, cnt FROM facet_engine WHERE engine_code != ''").fetchall()
+        yards = conn.execute("SELECT junkyard, cnt FROM facet_yard WHERE junkyard != ''").fetchall()
+    return {'model_name': dict(models), 'model_detail': dict(details), 'engine_code': dict(engines), 'junkyard': dict(yards)}
+
+# ---------------------------------------------------------
+# 인메모리 컬럼형 엔진 (modules/columnar.py) 연동
+# ---------------------------------------------------------
+# inventory 세대가 엔진 세대와 같을 때만 엔진으로 응답, 아니면 SQL로 응답하면서 백그라운드에서 갱신
+# 변경 행 추적: writer 커넥션에만 붙는 TEMP 트리거 → temp.vehicle_changes (이 프로세스의 쓰기)
+# 변경 행이 적으면 그 행만 다시 읽어 끼워 넣고, 많으면 전체 스냅샷 재구축
+# 다른 프로세스의 커밋(external_writes)은 바뀐 행을 알 수 없으므로 전체 재구축
+# 환경변수 COLUMNAR_ENGINE=0 이면 끄고 SQLite 인덱스로만 조회 (기본 켬, 메모리 100만 행당 약 120MB)
+USE_COLUMNAR_ENGINE = os.environ.get('COLUMNAR_ENGINE', '1').strip().lower() not in ('0', 'false', 'off', 'no')
+COLUMNAR_INCREMENTAL_MAX = 20000
+COLUMNAR_TRACKED = ['vin', 'reg_date', 'reg_month', 'manufacturer', 'model_name', 'model_detail', 'engine_code',
+                    'junkyard', 'model_year', 'price', 'photo_count']
+COLUMNAR_SNAPSHOT_SQL = '''SELECT rowid AS rid, vin, reg_date, reg_month, manufacturer, model_name, model_detail, engine_code, junkyard,
+    CASE WHEN typeof(model_year) IN ('integer', 'real') THEN model_year END AS model_year,
+    (price > 0) AS has_price, (photo_count > 0) AS has_photo
+    FROM vehicle_data'''
+
+_columnar_lock = threading.Lock()
+_columnar_refresh_lock = threading.Lock()
+_columnar = {'engine': None, 'building': False, 'tracking': False, 'external': None, 'last_build': None}
+
+def _drain_vehicle_changes():
+    # 마지막 갱신 이후 바뀐 rowid 목록을 꺼내고 비움 (최초 호출 시 추적 트리거 설치)
+    # None = 전체 재구축 필요 (최초 호출 또는 다른 프로세스의 커밋)
+    with write_conn(INVENTORY_DB) as conn:
+        count = external_writes(INVENTORY_DB)
+        external, _columnar['external'] = count != _columnar['external'], count
+        if not _columnar['tracking']:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS vehicle_changes (rid INTEGER)")
+            cols = ', '.join(COLUMNAR_TRACKED)
+            conn.execute("CREATE TEMP TRIGGER IF NOT EXISTS vehicle_changes_ai AFTER INSERT ON main.vehicle_data BEGIN INSERT INTO vehicle_changes VALUES (new.rowid); END")
+            conn.execute("CREATE TEMP TRIGGER IF NOT EXISTS vehicle_changes_ad AFTER DELETE ON main.vehicle_data BEGIN INSERT INTO vehicle_changes VALUES (old.rowid); END")
+            conn.execute(f"CREATE TEMP TRIGGER IF NOT EXISTS vehicle_changes_au AFTER UPDATE OF {cols} ON main.vehicle_data BEGIN INSERT INTO vehicle_changes VALUES (old.rowid); INSERT INTO vehicle_changes VALUES (new.rowid); END")
+            _columnar['tracking'] = True
+            conn.execute("DELETE FROM vehicle_changes")
+            return None
+        rids = [r[0] for r in conn.execute("SELECT DISTINCT rid FROM vehicle_changes").fetchall()]
+        conn.execute("DELETE FROM vehicle_changes")
+    return None if external else rids
+
+def load_columnar_snapshot(rids=None):
+    # rids=None 이면 전체, 아니면 해당 rowid 행만 (삭제된 행은 결과에 없음)
+    with read_conn(INVENTORY_DB) as conn:
+        if rids is None:
+            return pd.read_sql(COLUMNAR_SNAPSHOT_SQL, conn)
+        parts = [pd.read_sql(f"{COLUMNAR_SNAPSHOT_SQL} WHERE rowid IN ({','.join(['?'] * len(chunk))})", conn, params=chunk)
+                 for chunk in (rids[i:i + 900] for i in range(0, len(rids), 900))]
+        if not parts: parts = [pd.read_sql(f"{COLUMNAR_SNAPSHOT_SQL} WHERE 0", conn)]
+    return pd.concat(parts, ignore_index=True)
+
+def refresh_columnar_engine():
+    # 갱신은 한 번에 하나씩 (변경 목록을 나눠 가져가면 일부가 빠짐)
+    # 세대는 변경 목록을 비우기 전에 읽음 → 이후 쓰기는 다음 갱신에서 반영
+    with _columnar_refresh_lock:
+        gen = inventory_generation()
+        eng = _columnar['engine']
+        if eng is not None and eng.generation == gen: return eng
+        start = time.time()
+        rids = _drain_vehicle_changes()
+        new, mode = None, 'incremental'
+        if eng is not None and rids is not None and len(rids) <= COLUMNAR_INCREMENTAL_MAX:
+            new = eng.apply_changes(rids, load_columnar_snapshot(rids), gen) if rids else eng.retag(gen)
+        if new is None:
+            new, mode = ColumnarInventory.from_frame(load_columnar_snapshot(), gen), 'full'
+        _columnar.update({'engine': new, 'last_build': {'mode': mode, 'rows': new.n, 'changed': len(rids or []),
+                                                         'seconds': round(time.time() - start, 3), 'generation': gen}})
+        return new
+
+def _refresh_columnar_bg():
+    try: refresh_columnar_engine()
+    except Exception as e: print(f"Columnar Engine Error: {e}")
+    finally:
+        with _columnar_lock: _columnar['building'] = False
+
+def columnar_engine(wait=False):
+    # 현재 세대의 엔진 (없으면 None → 호출 측은 SQL 사용). wait=True 면 갱신을 기다림 (벤치마크/관리용)
+    if not USE_COLUMNAR_ENGINE: return None
+    eng = _columnar['engine']
+    if eng is not None and eng.generation == inventory_generation(): return eng
+    if wait: return refresh_columnar_engine()
+    with _columnar_lock:
+        if _columnar['building']: return None
+        _columnar['building'] = True
+    threading.Thread(target=_refresh_columnar_bg, daemon=True).start()
+    return None
+
+def columnar_stats():
+    eng = _columnar['engine']
+    return {'enabled': USE_COLUMNAR_ENGINE, 'rows': eng.n if eng else 0, 'memory_mb': round(eng.memory_bytes() / 2**20, 1) if eng else 0,
+            'generation': eng.generation if eng else None, 'current_generation': inventory_generation(),
+            'last_build': _columnar['last_build']}
+
+def _columnar_select(eng, maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text):
+    positions = None
+    fts_q = build_fts_query(text)
+    if fts_q:
+        # 같은 검색어의 페이지 이동/카운트는 엔진에 붙은 메모에서 재사용 (엔진이 바뀌면 함께 폐기)
+        positions = eng.memo.get(('fts', fts_q))
+        if positions is None:
+            with read_conn(INVENTORY_DB) as conn:
+                rids = np.array(conn.execute("SELECT rowid FROM vehicle_fts WHERE vehicle_fts MATCH ?", (fts_q,)).fetchall(), dtype=np.int64).ravel()
+            positions = eng.positions_of(rids)
+            if len(eng.memo) >= 64: eng.memo.clear()
+            eng.memo[('fts', fts_q)] = positions
+    categorical = {'manufacturer': [maker] if maker and maker != "All" else [], 'model_name': models,
+                   'model_detail': details, 'engine_code': engines, 'junkyard': yards}
+    return eng.select(categorical, (sy, ey), (month_to_int(sm), month_to_int(em)), only_photo, only_price, positions)
+
+# 키셋 페이지네이션: 정렬키 (reg_month, reg_date, vin) 기준 커서 다음/이전 페이지 조회
+# text: 모델/세부모델/엔진코드/VIN 자유 검색어 (FTS5, 구조화 필터와 AND 결합)
+# count는 첫 페이지에서만 필요하므로 with_count=False면 None 반환 (count_data 별도 캐시)
+SEARCH_COLUMNS = "v.vin, v.reg_date, v.reg_month, v.car_no, v.manufacturer, v.model_name, v.model_detail, v.model_year, v.junkyard, v.engine_code, v.price, v.mileage, v.photos, v.photo_count, j.region, j.address, j.region_code"
+# 세션 언어별 미리 번역된 주소 컬럼 (한국어 화면도 바이어에게는 시/도 수준 영문 주소만 노출)
+ADDRESS_COLUMNS = {'English': 'address_en', 'Korean': 'address_en', 'Russian': 'address_ru', 'Arabic': 'address_ar'}
+
+def search_columns(lang='English'):
+    return f"{SEARCH_COLUMNS}, j.{ADDRESS_COLUMNS.get(lang, 'address_en')} AS address_local"
+
+def _finish_page(df):
+    if not df.empty:
+        df['model_year'] = pd.to_numeric(df['model_year'], errors='coerce').fillna(0)
+        # 커서는 저장된 문자열 그대로 사용 (파싱 안 되는 날짜는 NaT 가 되므로)
+        df['reg_date_raw'] = df['reg_date']
+        df['reg_date'] = pd.to_datetime(df['reg_date'], errors='coerce')
+    return df
+
+def _sql_search_page(maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text,
+                     cursor, direction, page_size, lang='English'):
+    with read_conn(INVENTORY_DB) as conn:
+        broad = bool(build_fts_query(text)) and fts_is_broad(conn, build_fts_query(text))
+    cond, params = build_search_filter(maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text, broad)
+    page_cond, page_params = cond, list(params)
+    if cursor:
+        page_cond += f" AND (v.reg_month, v.reg_date, v.vin) {'<' if direction == 'next' else '>'} (?, ?, ?)"
+        page_params.extend(cursor)
+    order = "DESC" if direction == 'next' else "ASC"
         
-        if maker and maker != "All":
-            cond += " AND v.manufacturer = ?"; params.append(maker)
-        cond += " AND v.model_year >= ? AND v.model_year <= ?"; params.extend([sy, ey])
-        cond += " AND strftime('%Y-%m', v.reg_date) >= ? AND strftime('%Y-%m', v.reg_date) <= ?"; params.extend([sm, em])
-        if models:
-            cond += f" AND v.model_name IN ({','.join(['?']*len(models))})"; params.extend(models)
-        if details:
-            cond += f" AND v.model_detail IN ({','.join(['?']*len(details))})"; params.extend(details)
-        if engines:
-            cond += f" AND v.engine_code IN ({','.join(['?']*len(engines))})"; params.extend(engines)
-        if yards:
-            cond += f" AND v.junkyard IN ({','.join(['?']*len(yards))})"; params.extend(yards)
-
-        if only_photo:
-            cond += " AND v.photos IS NOT NULL AND v.photos != ''"
-        if only_price:
-            cond += " AND v.price > 0"
-            
-        q = f"SELECT v.vin, v.reg_date, v.car_no, v.manufacturer, v.model_name, v.model_detail, v.model_year, v.junkyard, v.engine_code, v.price, v.mileage, v.photos, j.region, j.address FROM vehicle_data v LEFT JOIN junkyard_info j ON v.junkyard = j.name WHERE {cond} ORDER BY v.reg_date DESC LIMIT 5000"
-        count = conn.execute(f"SELECT COUNT(*) FROM vehicle_data v WHERE {cond}", params).fetchone()[0]
-        df = pd.read_sql(q, conn, params=params)
-        conn.close()
-        if not df.empty:
-            df['model_year'] = pd.to_numeric(df['model_year'], errors='coerce').fillna(0)
-            df['reg_date'] = pd.to_datetime(df['reg_date'], errors='coerce')
+    q = f"SELECT {search_columns(lang)} FROM vehicle_data v LEFT JOIN junkyard_info j ON v.junkyard = j.name WHERE {page_cond} ORDER BY v.reg_month {order}, v.reg_date {order}, v.vin {order} LIMIT ?"
+    with read_conn(INVENTORY_DB) as conn:
+        df = pd.read_sql(q, conn, params=page_params + [int(page_size)])
+    if direction != 'next':
+        df = df.iloc[::-1].reset_index(drop=True)
+    return _finish_page(df)
+
+def _columnar_search_page(eng, maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text,
+                          cursor, direction, page_size, lang='English'):
+    # 엔진이 고른 페이지 rowid만 SQLite에서 읽고 엔진 순서대로 재배열
+    cands = _columnar_select(eng, maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text)
+    rids = eng.rid[eng.page(cands, cursor, direction, int(page_size))].tolist()
+    q = f"SELECT v.rowid, {search_columns(lang)} FROM vehicle_data v LEFT JOIN junkyard_info j ON v.junkyard = j.name WHERE v.rowid IN ({','.join(['?'] * len(rids))})"
+    with read_conn(INVENTORY_DB) as conn:
+        cur = conn.execute(q, rids)
+        by_rid = {r[0]: r[1:] for r in cur.fetchall()}
+        cols = [d[0] for d in cur.description[1:]]
+    return _finish_page(pd.DataFrame([by_rid[r] for r in rids if r in by_rid], columns=cols))
+
+@inventory_cached
+def _search_page(maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text,
+                 cursor, direction, page_size, lang):
+    eng = columnar_engine()
+    if eng is not None:
+        return _columnar_search_page(eng, maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text,
+                                     cursor, direction, page_size, lang)
+    return _sql_search_page(maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text,
+                            cursor, direction, page_size, lang)
+
+# 결과 DataFrame은 세션 간 공유되므로 수정하려면 copy() 후 사용
+def search_data(maker, models, details, engines, sy, ey, yards, sm, em, only_photo=False, only_price=False, text='',
+                cursor=None, direction='next', page_size=PAGE_SIZE, with_count=True, lang='English', user_id=None):
+    try:
+        df = _search_page(maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text,
+                          cursor, direction, int(page_size), lang)
+        count = count_data(maker, models, details, engines, sy, ey, yards, sm, em, only_photo, only_price, text) if with_count else None
+        # 새 검색만 수요 로그로 (페이지 이동은 제외), 큐에 넣기만 하므로 검색 지연 없음
+        if cursor is None: log_search(user_id, maker, models, engines, text, count)
         return df, count
     except: return pd.DataFrame(), 0
 
+def page_cursors(df):
+    # 현재 페이지의 (첫 행, 마지막 행) 커서
+    # 등록월이 없는 행은 컬럼형 엔진과 같은 -1 로 표시
+    if df is None or df.empty or 'reg_date_raw' not in df.columns: return None, None
+    def _cursor(r): return (-1 if pd.isna(r['reg_month']) else int(r['reg_month']), r['reg_date_raw'], r['vin'])
+    return _cursor(df.iloc[0]), _cursor(df.iloc[-1])
+
+def store_photo_file(f):
+    # 업로드 1건 → 내용 주소 경로에 저장하고 (path, size, width, height, sha256) 반환
+    # 이미 있는 내용이면 임시 파일만 지우고 기존 파일 재사용 (mtime 갱신 → GC 유예 시간 동안 보호)
+    if not os.path.exists(IMAGE_DIR): os.makedirs(IMAGE_DIR)
+    tmp, digest, size = images.stream_to_temp(f, IMAGE_DIR)
+    with read_conn(INVENTORY_DB) as conn:
+        row = conn.execute("SELECT path FROM photo_blobs WHERE sha256 = ?", (digest,)).fetchone()
+    ext = os.path.splitext(getattr(f, 'name', ''))[1].lower() or '.jpg'
+    path = row[0] if row and os.path.exists(row[0]) else images.blob_path(IMAGE_DIR, digest, ext)
+    try:
+        # 기존 파일 재사용 (GC 가 막 지운 경우 FileNotFoundError → 새로 저장)
+        os.utime(path)
+        os.remove(tmp)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp, path)
+    return (path, size) + tuple(images.image_size(path)) + (digest,)
+
 def update_vehicle_sales_info(vin, price, mileage, photo_files):
     try:
-        conn = sqlite3.connect(INVENTORY_DB)
-        saved_paths = []
-        if photo_files:
-            if not os.path.exists(IMAGE_DIR): os.makedirs(IMAGE_DIR)
-            for f in photo_files:
-                fname = f"{vin}_{datetime.datetime.now().strftime('%H%M%S')}_{f.name}"
-                fpath = os.path.join(IMAGE_DIR, fname)
-                with open(fpath, "wb") as buffer:
-                    shutil.copyfileobj(f, buffer)
-                saved_paths.append(fpath)
-        
-        if saved_paths:
-            photo_str = ",".join(saved_paths)
-            sql = "UPDATE vehicle_data SET price = ?, mileage = ?, photos = ? WHERE vin = ?"
-            params = (price, mileage, photo_str, vin)
-        else:
-            sql = "UPDATE vehicle_data SET price = ?, mileage = ? WHERE vin = ?"
-            params = (price, mileage, vin)
-            
-        conn.execute(sql, params)
-        conn.commit()
-        conn.close()
+        saved = list({p[0]: p for p in (store_photo_file(f) for f in photo_files or [])}.values())
+
+        with write_conn(INVENTORY_DB) as conn:
+            if saved:
+                # 새 사진 업로드 시 기존 목록 교체 (photos 문자열은 구버전 호환용으로 함께 유지)
+                conn.execute("UPDATE vehicle_data SET price = ?, mileage = ?, photos = ? WHERE vin = ?", (price, mileage, ",".join(p[0] for p in saved), vin))
+                conn.execute("DELETE FROM vehicle_photos WHERE vin = ?", (vin,))
+                insert_vehicle_photos(conn, vin, saved)
+            else:
+                conn.execute("UPDATE vehicle_data SET price = ?, mileage = ? WHERE vin = ?", (price, mileage, vin))
+        bump_generation('inventory')
+        if saved: enqueue_renditions(vin)
         return True
     except Exception as e:
         print(f"Update Error: {e}")
         return False
 
-@st.cache_data(ttl=300)
+@photos_cached
+def get_vehicle_photos(vin):
+    # 상세 화면용 사진 목록 (size 가 None 이면 저장 당시 파일 없음) → rerun 마다 파일 시스템 조회 안 함
+    with read_conn(INVENTORY_DB) as conn:
+        return pd.read_sql("SELECT path, size, width, height, sha256, thumb_path, medium_path FROM vehicle_photos WHERE vin = ? ORDER BY id",
+                           conn, params=(vin,))
+
+# ---------------------------------------------------------
+# 사진 변환 워커 (modules/images.py)
+# ---------------------------------------------------------
+# 업로드 요청은 원본 저장까지만 하고 바로 반환, 썸네일/중간 크기 변환은 백그라운드 스레드에서 생성
+# 재시작 시 생성 대기(thumb_path IS NULL) 사진을 다시 등록, 같은 파일(내용 주소)은 한 번만 변환
+RENDITION_WORKERS = 1
+_rendition_queue = queue.Queue()
+_rendition_lock = threading.Lock()
+_rendition_state = {'started': False, 'done': 0, 'failed': 0}
+PENDING_RENDITIONS_SQL = "SELECT DISTINCT path FROM vehicle_photos WHERE thumb_path IS NULL AND size IS NOT NULL"
+
+def _rendition_worker():
+    while True:
+        path = _rendition_queue.get()
+        try:
+            with read_conn(INVENTORY_DB) as conn:
+                pending = conn.execute("SELECT 1 FROM vehicle_photos WHERE path = ? AND thumb_path IS NULL", (path,)).fetchone()
+            if not pending: continue
+            try: out = images.make_renditions(path)
+            except Exception as e:
+                print(f"Rendition Error ({path}): {e}")
+                out = {}
+            with write_conn(INVENTORY_DB) as conn:
+                conn.execute("UPDATE vehicle_photos SET thumb_path = ?, medium_path = ? WHERE path = ?",
+                             (out.get('thumb', ''), out.get('medium', ''), path))
+            bump_generation('photos')
+            _rendition_state['done' if out else 'failed'] += 1
+        except Exception as e:
+            print(f"Rendition Worker Error: {e}")
+        finally:
+            _rendition_queue.task_done()
+
+def start_rendition_worker():
+    # 최초 1회만 워커 시작 + 대기 사진 전체 등록 → 시작했으면 True
+    with _rendition_lock:
+        if _rendition_state['started']: return False
+        _rendition_state['started'] = True
+        for _ in range(RENDITION_WORKERS):
+            threading.Thread(target=_rendition_worker, daemon=True).start()
+    with read_conn(INVENTORY_DB) as conn:
+        for row in conn.execute(PENDING_RENDITIONS_SQL).fetchall(): _rendition_queue.put(row[0])
+    return True
+
+def enqueue_renditions(vin):
+    if start_rendition_worker(): return
+    with read_conn(INVENTORY_DB) as conn:
+        for row in conn.execute(f"{PENDING_RENDITIONS_SQL} AND vin = ?", (vin,)).fetchall(): _rendition_queue.put(row[0])
+
+def rendition_stats():
+    return {'queued': _rendition_queue.qsize(), 'done': _rendition_state['done'], 'failed': _rendition_state['failed'],
+            'format': images.RENDITION_FORMAT}
+
+# ---------------------------------------------------------
+# 사진 저장소 정리 (GC)
+# ---------------------------------------------------------
+# 참조 수 0 인 blob 행 삭제 + IMAGE_DIR 에서 어떤 사진 행(원본/변환본)도 가리키지 않는 파일 삭제
+# 방금 저장되어 아직 DB에 등록 전인 파일/작성 중인 임시 파일은 유예 시간(mtime 기준)으로 보호
+GC_GRACE_SECONDS = 3600
+
+def gc_photo_blobs(dry_run=False, grace=GC_GRACE_SECONDS):
+    cutoff = time.time() - grace
+    removed, freed = [], 0
+    # 쓰기 락 안에서는 참조 경로 스냅샷 + blob 행 삭제만, 파일 순회/삭제는 락 밖에서 (업로드/수정/변환본 작업을 막지 않음)
+    # 스냅샷 이후 새로 참조된 파일은 저장/재사용/변환 시 mtime 이 갱신되므로 유예 시간으로 보호
+    with write_conn(INVENTORY_DB) as conn:
+        keep = set()
+        for row in conn.execute("SELECT path, thumb_path, medium_path FROM vehicle_photos").fetchall():
+            keep.update(os.path.normpath(p) for p in row if p)
+        blobs = conn.execute("SELECT COUNT(*) FROM photo_blobs WHERE refcount <= 0").fetchone()[0]
+        if not dry_run: conn.execute("DELETE FROM photo_blobs WHERE refcount <= 0")
+    for root, dirs, files in os.walk(IMAGE_DIR):
+        for name in files:
+            path = os.path.normpath(os.path.join(root, name))
+            if path in keep: continue
+            try:
+                info = os.stat(path)
+                if info.st_mtime > cutoff: continue
+                if not dry_run: os.remove(path)
+            except OSError:
+                continue
+            removed.append(path)
+            freed += info.st_size
+    if not dry_run:
+        for root, dirs, files in os.walk(IMAGE_DIR, topdown=False):
+            try:
+                if root != IMAGE_DIR and not os.listdir(root): os.rmdir(root)
+            except OSError:
+                pass
+    return {'files': len(removed), 'bytes': freed, 'blobs': blobs, 'dry_run': dry_run}
+
+@inventory_cached
 def load_metadata():
-    conn = sqlite3.connect(INVENTORY_DB)
-    df_m = pd.read_sql("SELECT DISTINCT manufacturer, model_name FROM vehicle_data WHERE manufacturer IS NOT NULL ORDER BY manufacturer, model_name", conn)
-    df_e = pd.read_sql("SELECT DISTINCT engine_code FROM vehicle_data", conn)
-    df_y = pd.read_sql("SELECT name FROM junkyard_info", conn)
-    try: months = pd.read_sql("SELECT DISTINCT strftime('%Y-%m', reg_date) as m FROM vehicle_data ORDER BY m DESC", conn)['m'].tolist()
-    except: months = []
-    total = conn.execute("SELECT COUNT(*) FROM vehicle_data").fetchone()[0]
-    conn.close()
+    # 필터 목록은 패싯 테이블(트리거로 유지)에서만 읽음 → 재고 규모와 무관
+    with read_conn(INVENTORY_DB) as conn:
+        df_m = pd.read_sql("SELECT DISTINCT manufacturer, model_name FROM facet_model WHERE manufacturer != '' ORDER BY manufacturer, model_name", conn)
+        df_e = pd.read_sql("SELECT engine_code FROM facet_engine WHERE engine_code != '' ORDER BY engine_code", conn)
+        # 재고가 있는 폐차장만 (재고 없는 폐차장을 골라도 결과가 없으므로)
+        df_y = pd.read_sql("SELECT junkyard AS name FROM facet_yard WHERE junkyard != '' ORDER BY junkyard", conn)
+        months = [int_to_month(r[0]) for r in conn.execute("SELECT reg_month FROM facet_month WHERE reg_month > 0 ORDER BY reg_month DESC").fetchall()]
+        total = conn.execute("SELECT COALESCE(SUM(cnt), 0) FROM facet_month").fetchone()[0]
     return df_m, df_e['engine_code'].tolist(), df_y['name'].tolist(), months, pd.DataFrame(), total
 
 def reset_dashboard():
@@ -446,73 +1534,408 @@ def reset_dashboard():
     st.session_state.update({
         'view_data': pd.DataFrame(), 'total_count': init_total, 'models_df': m_df,
         'engines_list': m_eng, 'yards_list': m_yards, 'months_list': m_mon,
-        'is_filtered': False, 'selected_vin': None
+        'is_filtered': False, 'selected_vin': None, 'search_args': None, 'page_no': 0
     })
 
 def place_order(buyer_id, target_partner, vin, model_info):
     try:
-        conn = sqlite3.connect(SYSTEM_DB)
         summary = f"Inquiry for {model_info} (VIN: {vin})"
-        conn.execute('''INSERT INTO orders 
-                        (buyer_id, target_partner_alias, real_junkyard_name, items_summary, status) 
-                        VALUES (?, ?, ?, ?, ?)''', 
-                     (buyer_id, target_partner, target_partner, summary, 'PENDING'))
-        conn.commit()
-        conn.close()
+        with write_conn(SYSTEM_DB) as conn:
+            conn.execute('''INSERT INTO orders 
+                            (buyer_id, target_partner_alias, real_junkyard_name, items_summary, status) 
+                            VALUES (?, ?, ?, ?, ?)''', 
+                         (buyer_id, target_partner, target_partner, summary, 'PENDING'))
+            row = conn.execute("SELECT email FROM users WHERE user_id = ?", (target_partner,)).fetchone()
+        # 파트너 알림: 같은 파트너 앞 문의는 MAIL_BATCH_WINDOW 동안 모아 한 통으로
+        if row and row[0]:
+            queue_email(row[0], "[K-Used Car] New inquiry", f"{summary}\nPlease check the Orders tab.", batch_key=f"inquiry:{target_partner}")
+        bump_generation('orders')
         return True
     except Exception as e:
         print(f"Order Error: {e}")
         return False
 
+def update_orders(order_ids, status=None, reply=None, partner=None):
+    # 여러 주문의 상태/답변을 한 트랜잭션·한 문장으로 변경 (빈 값은 기존 값 유지)
+    # partner 를 주면 해당 파트너 주문만 변경 → 변경된 건수
+    ids = [int(i) for i in order_ids]
+    if not ids or not (status or reply): return 0
+    scope, extra = ("AND real_junkyard_name = ?", [partner]) if partner else ("", [])
+    changed = 0
+    with write_conn(SYSTEM_DB) as conn:
+        for i in range(0, len(ids), 900):
+            chunk = ids[i:i + 900]
+            changed += conn.execute(f"""UPDATE orders SET status = COALESCE(?, status), reply_text = COALESCE(?, reply_text)
+                                        WHERE id IN ({','.join(['?'] * len(chunk))}) {scope}""",
+                                    [status or None, reply or None] + chunk + extra).rowcount
+    if changed: bump_generation('orders')
+    return changed
+
 def update_order(order_id, status=None, reply=None):
-    conn = sqlite3.connect(SYSTEM_DB)
     try:
-        if status:
-            conn.execute("UPDATE orders SET status = ? WHERE id = ?", (status, order_id))
-        if reply:
-            conn.execute("UPDATE orders SET reply_text = ? WHERE id = ?", (reply, order_id))
-        conn.commit()
+        update_orders([order_id], status, reply)
         return True
     except Exception as e:
         print(e)
         return False
-    finally:
-        conn.close()
 
-def get_orders(user_id, role):
-    conn = sqlite3.connect(SYSTEM_DB)
+# 주문함: 역할별 범위 + 상태/기간 필터, (created_at, id) 역순 키셋 페이지
+ORDER_STATUSES = ["PENDING", "CONFIRMED", "SHIPPED", "CANCELLED"]
+ORDER_PAGE_SIZE = 20
+
+def build_order_filter(user_id, role, status=None, date_from=None, date_to=None):
+    cond, params = ["1=1"], []
+    if role == 'partner':
+        cond.append("real_junkyard_name = ?"); params.append(user_id)
+    elif role != 'admin':
+        cond.append("buyer_id = ?"); params.append(user_id)
+    if status:
+        cond.append("status = ?"); params.append(status)
+    if date_from:
+        cond.append("created_at >= ?"); params.append(str(date_from))
+    if date_to:
+        # 종료일 포함 (created_at 은 'YYYY-MM-DD HH:MM:SS')
+        cond.append("created_at < ?"); params.append(str(pd.Timestamp(date_to).date() + datetime.timedelta(days=1)))
+    return " AND ".join(cond), params
+
+@orders_cached
+def _get_orders(user_id, role, status, date_from, date_to, cursor, page_size):
+    cond, params = build_order_filter(user_id, role, status, date_from, date_to)
+    if cursor:
+        cond += " AND (created_at, id) < (?, ?)"
+        params.extend(cursor)
+    with read_conn(SYSTEM_DB) as conn:
+        return pd.read_sql(f"SELECT * FROM orders WHERE {cond} ORDER BY created_at DESC, id DESC LIMIT ?", conn, params=params + [int(page_size)])
+
+def get_orders(user_id, role, status=None, date_from=None, date_to=None, cursor=None, page_size=ORDER_PAGE_SIZE):
+    # cursor: 이전 페이지 마지막 행의 (created_at, id) → order_cursor(df)
+    try: return _get_orders(user_id, role, status, date_from, date_to, cursor, page_size)
+    except Exception as e:
+        print(f"Order Query Error: {e}")
+        return pd.DataFrame()
+
+def order_cursor(df):
+    if df is None or df.empty: return None
+    last = df.iloc[-1]
+    return (last['created_at'], int(last['id']))
+
+@orders_cached
+def _order_status_counts(user_id, role, date_from, date_to):
+    cond, params = build_order_filter(user_id, role, None, date_from, date_to)
+    with read_conn(SYSTEM_DB) as conn:
+        return dict(conn.execute(f"SELECT status, COUNT(*) FROM orders WHERE {cond} GROUP BY status", params).fetchall())
+
+def order_status_counts(user_id, role, date_from=None, date_to=None):
+    # {상태: 건수} (상태 필터 탭/라벨용, 상태 조건 제외)
+    try: return _order_status_counts(user_id, role, date_from, date_to)
+    except: return {}
+
+# ---------------------------------------------------------
+# 검색 수요 로그 (search_logs_v2 + demand_hourly / demand_daily)
+# ---------------------------------------------------------
+# 검색 스레드는 튜플 하나를 큐에 넣고 끝 (가득 차면 버림), 기록 스레드가 모아서 한 트랜잭션으로 저장
+# 집계 테이블은 배치마다 (구간, 차원, 값)별 건수를 UPSERT 로 더함 → 대시보드는 원본 로그를 읽지 않음
+# 차원: total(전체 검색 수), country, maker, model, engine, keyword / 시각은 UTC (created_at 과 동일)
+SEARCH_LOG_BATCH = 500
+SEARCH_LOG_FLUSH_SECONDS = 2
+SEARCH_LOG_QUEUE_MAX = 50000
+_search_log_queue = queue.Queue(maxsize=SEARCH_LOG_QUEUE_MAX)
+_search_log_lock = threading.Lock()
+_search_log_state = {'started': False, 'logged': 0, 'dropped': 0, 'flushes': 0}
+
+def log_search(user_id, maker, models, engines, text, count, search_type='vehicle'):
     try:
-        if role == 'admin': 
-            q = "SELECT * FROM orders ORDER BY created_at DESC"
-        elif role == 'partner': 
-            q = f"SELECT * FROM orders WHERE real_junkyard_name = '{user_id}' ORDER BY created_at DESC"
-        else: 
-            q = f"SELECT * FROM orders WHERE buyer_id = '{user_id}' ORDER BY created_at DESC"
-        df = pd.read_sql(q, conn)
-    except: df = pd.DataFrame()
-    conn.close()
-    return df
+        _search_log_queue.put_nowait((time.time(), user_id, maker, tuple(models or ()), tuple(engines or ()),
+                                      str(text or '').strip()[:100], count, search_type))
+    except queue.Full:
+        _search_log_state['dropped'] += 1
+        return
+    if not _search_log_state['started']: start_search_log_writer()
+
+def _demand_keys(maker, models, engines, text, country):
+    keys = [('total', '')]
+    if country: keys.append(('country', country))
+    if maker and maker != 'All': keys.append(('maker', maker))
+    keys += [('model', m if not maker or maker == 'All' else f"{maker} {m}") for m in models]
+    keys += [('engine', e) for e in engines]
+    if text: keys.append(('keyword', text.lower()))
+    return keys
+
+def flush_search_logs(batch):
+    users = list({r[1] for r in batch if r[1]})
+    countries = {}
+    if users:
+        with read_conn(SYSTEM_DB) as conn:
+            countries = dict(conn.execute(f"SELECT user_id, country FROM users WHERE user_id IN ({','.join(['?'] * len(users))})", users).fetchall())
+    logs, hourly, daily = [], {}, {}
+    for ts, uid, maker, models, engines, text, count, stype in batch:
+        at = datetime.datetime.fromtimestamp(ts, datetime.timezone.utc)
+        country = countries.get(uid) or ''
+        logs.append((text, stype, at.strftime('%Y-%m-%d %H:%M:%S'), uid, country, maker, ','.join(models), ','.join(engines), count))
+        hour, day = at.strftime('%Y-%m-%d %H'), at.strftime('%Y-%m-%d')
+        for dim, value in _demand_keys(maker, models, engines, text, country):
+            hourly[(hour, dim, value)] = hourly.get((hour, dim, value), 0) + 1
+            daily[(day, dim, value)] = daily.get((day, dim, value), 0) + 1
+    with write_conn(SYSTEM_DB) as conn:
+        conn.executemany('''INSERT INTO search_logs_v2 (keyword, search_type, created_at, user_id, country, manufacturer, models, engines, result_count)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', logs)
+        for table, agg in [('demand_hourly', hourly), ('demand_daily', daily)]:
+            conn.executemany(f'''INSERT INTO {table} (bucket, dim, value, cnt) VALUES (?, ?, ?, ?)
+                                 ON CONFLICT(bucket, dim, value) DO UPDATE SET cnt = cnt + excluded.cnt''',
+                             [k + (v,) for k, v in agg.items()])
+    bump_generation('demand')
+    _search_log_state['logged'] += len(batch)
+    _search_log_state['flushes'] += 1
+
+def _search_log_writer():
+    while True:
+        batch = [_search_log_queue.get()]
+        deadline = time.time() + SEARCH_LOG_FLUSH_SECONDS
+        while len(batch) < SEARCH_LOG_BATCH:
+            try: batch.append(_search_log_queue.get(timeout=max(0, deadline - time.time())))
+            except queue.Empty: break
+        try: flush_search_logs(batch)
+        except Exception as e:
+            print(f"Search Log Error: {e}")
+            _search_log_state['dropped'] += len(batch)
+
+def start_search_log_writer():
+    with _search_log_lock:
+        if _search_log_state['started']: return False
+        _search_log_state['started'] = True
+    threading.Thread(target=_search_log_writer, daemon=True).start()
+    return True
+
+def search_log_stats():
+    return dict(_search_log_state, queued=_search_log_queue.qsize())
+
+def _demand_since(hours):
+    # 48시간 이하는 시간 단위, 그 이상은 일 단위 집계에서 읽음
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=hours)
+    if hours <= 48: return 'demand_hourly', since.strftime('%Y-%m-%d %H')
+    return 'demand_daily', since.strftime('%Y-%m-%d')
+
+@demand_cached
+def demand_top(dim, hours=24 * 7, limit=10):
+    table, since = _demand_since(hours)
+    with read_conn(SYSTEM_DB) as conn:
+        return pd.read_sql(f"SELECT value, SUM(cnt) AS searches FROM {table} WHERE dim = ? AND bucket >= ? GROUP BY value ORDER BY searches DESC LIMIT ?",
+                           conn, params=(dim, since, int(limit)))
+
+@demand_cached
+def demand_trend(hours=24 * 7):
+    table, since = _demand_since(hours)
+    with read_conn(SYSTEM_DB) as conn:
+        return pd.read_sql(f"SELECT bucket, cnt AS searches FROM {table} WHERE dim = 'total' AND bucket >= ? ORDER BY bucket", conn, params=(since,))
+
+# ---------------------------------------------------------
+# 메일 발송함 (modules/mailer.py)
+# ---------------------------------------------------------
+# queue_email: 첨부파일을 data/outbox 로 스트리밍 복사하고 발송함 행만 추가 → 호출 스레드는 바로 반환
+# 발송 스레드: 기한이 된 메일을 하나의 인증된 SMTP 연결로 연속 전송, 실패 시 지수 백오프로 재시도
+# batch_key 가 같은 알림(같은 수신자)은 모아서 한 통으로 발송
+OUTBOX_DIR = 'data/outbox'
+MAIL_CONFIG = None            # None 이면 st.secrets["EMAIL"] (테스트/로컬 서버용으로 직접 지정 가능)
+MAIL_BATCH_SIZE = 50
+MAIL_BATCH_WINDOW = 60        # 초
+MAIL_MAX_ATTEMPTS = 6
+MAIL_RETRY_BASE = 30          # 초, 시도마다 2배
+MAIL_RETRY_MAX = 3600
+MAIL_IDLE_CLOSE = 60          # 보낼 메일이 없을 때 SMTP 연결 유지 시간
+_mail_wake = threading.Event()
+_mail_lock = threading.Lock()
+_mail_state = {'started': False, 'sent': 0, 'retried': 0, 'failed': 0}
+MAIL_COLUMNS = "id, to_addr, subject, body, attachments, batch_key, attempts"
+
+def mail_config():
+    if MAIL_CONFIG is not None: return MAIL_CONFIG
+    try: return dict(st.secrets["EMAIL"]) if "EMAIL" in st.secrets else None
+    except: return None
+
+def queue_email(to_email, subject, content, attachment_files=None, batch_key=None):
+    if not to_email or "@" not in str(to_email) or mail_config() is None: return False
+    files = attachment_files if isinstance(attachment_files, list) else ([attachment_files] if attachment_files else [])
+    saved = []
+    try:
+        if files and not os.path.exists(OUTBOX_DIR): os.makedirs(OUTBOX_DIR)
+        for f in files:
+            path = os.path.join(OUTBOX_DIR, f"{uuid.uuid4().hex}_{os.path.basename(getattr(f, 'name', '') or 'attachment')}")
+            f.seek(0)
+            with open(path, 'wb') as out: shutil.copyfileobj(f, out, images.CHUNK_SIZE)
+            saved.append(path)
+        with write_conn(SYSTEM_DB) as conn:
+            conn.execute("INSERT INTO email_outbox (to_addr, subject, body, attachments, batch_key, next_attempt_at) VALUES (?, ?, ?, ?, ?, ?)",
+                         (to_email, subject, content, json.dumps(saved), batch_key, time.time() + (MAIL_BATCH_WINDOW if batch_key else 0)))
+    except Exception as e:
+        print(f"Mail Queue Error: {e}")
+        for p in saved:
+            try: os.remove(p)
+            except OSError: pass
+        return False
+    start_mail_sender()
+    _mail_wake.set()
+    return True
+
+def _due_mail_groups(conn, now):
+    # 기한이 된 메일 → [같은 batch_key/수신자 묶음, ...] (묶음에는 아직 기한 전인 같은 키 알림도 포함)
+    groups, seen = [], set()
+    for r in conn.execute(f"SELECT {MAIL_COLUMNS} FROM email_outbox WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                          (now, MAIL_BATCH_SIZE)).fetchall():
+        if r[0] in seen: continue
+        group = [r]
+        if r[5]:
+            group = conn.execute(f"SELECT {MAIL_COLUMNS} FROM email_outbox WHERE status = 'pending' AND batch_key = ? AND to_addr = ? ORDER BY id",
+                                 (r[5], r[1])).fetchall()
+        seen.update(g[0] for g in group)
+        groups.append(group)
+    return groups
+
+def _merge_mail(group):
+    attachments = [p for g in group for p in json.loads(g[4] or '[]')]
+    if len(group) == 1: return group[0][2], group[0][3], attachments
+    return f"{group[0][2]} (+{len(group) - 1})", "\n\n---\n\n".join(str(g[3]) for g in group), attachments
+
+def _finish_mail(ids, attachments, status, error=None):
+    marks = ','.join(['?'] * len(ids))
+    with write_conn(SYSTEM_DB) as conn:
+        conn.execute(f"UPDATE email_outbox SET status = ?, attempts = attempts + 1, last_error = ?, sent_at = CASE WHEN ? = 'sent' THEN CURRENT_TIMESTAMP END WHERE id IN ({marks})",
+                     [status, error, status] + ids)
+    for p in attachments:
+        try: os.remove(p)
+        except OSError: pass
+
+def _send_mail_groups(session, groups):
+    # 일시적 실패(연결/4xx)가 나면 그 메일은 백오프, 나머지는 같은 시각으로 미루고 중단 → False
+    for i, group in enumerate(groups):
+        ids = [g[0] for g in group]
+        subject, body, attachments = _merge_mail(group)
+        try:
+            session.send(group[0][1], subject, body, [(p, mailer.attachment_name(p)) for p in attachments if os.path.exists(p)])
+            _finish_mail(ids, attachments, 'sent')
+            _mail_state['sent'] += len(ids)
+        except Exception as e:
+            attempts = max(g[6] for g in group) + 1
+            if isinstance(e, mailer.PermanentMailError) or attempts >= MAIL_MAX_ATTEMPTS:
+                print(f"Mail Failed ({group[0][1]}): {e}")
+                _finish_mail(ids, attachments, 'failed', str(e))
+                _mail_state['failed'] += len(ids)
+                continue
+            session.close()
+            delay = min(MAIL_RETRY_BASE * 2 ** (attempts - 1), MAIL_RETRY_MAX) * random.uniform(1.0, 1.2)
+            later = [g[0] for rest in groups[i + 1:] for g in rest]
+            with write_conn(SYSTEM_DB) as conn:
+                conn.execute(f"UPDATE email_outbox SET attempts = attempts + 1, last_error = ?, next_attempt_at = ? WHERE id IN ({','.join(['?'] * len(ids))})",
+                             [str(e), time.time() + delay] + ids)
+                if later:
+                    conn.execute(f"UPDATE email_outbox SET next_attempt_at = ? WHERE id IN ({','.join(['?'] * len(later))})", [time.time() + delay] + later)
+            _mail_state['retried'] += len(ids)
+            return False
+    return True
+
+def _mail_sender():
+    session, last_used = None, 0
+    while True:
+        try:
+            cfg = mail_config()
+            while cfg is not None:
+                with read_conn(SYSTEM_DB) as conn:
+                    groups = _due_mail_groups(conn, time.time())
+                if not groups: break
+                if session is None: session = mailer.SmtpSession(cfg)
+                last_used = time.time()
+                if not _send_mail_groups(session, groups): break
+            if session is not None and time.time() - last_used >= MAIL_IDLE_CLOSE:
+                session.close()
+                session = None
+            with read_conn(SYSTEM_DB) as conn:
+                nxt = conn.execute("SELECT MIN(next_attempt_at) FROM email_outbox WHERE status = 'pending'").fetchone()[0]
+        except Exception as e:
+            print(f"Mail Sender Error: {e}")
+            nxt = None
+        # 다음 기한 / 연결 종료 시점 / 새 메일 알림 중 먼저 오는 것까지 대기
+        wait = MAIL_IDLE_CLOSE if nxt is None else min(max(nxt - time.time(), 0.05), MAIL_IDLE_CLOSE)
+        _mail_wake.wait(wait)
+        _mail_wake.clear()
+
+def start_mail_sender():
+    with _mail_lock:
+        if _mail_state['started']: return False
+        _mail_state['started'] = True
+    threading.Thread(target=_mail_sender, daemon=True).start()
+    return True
+
+def mail_outbox_stats():
+    with read_conn(SYSTEM_DB) as conn:
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM email_outbox GROUP BY status").fetchall())
+    return dict(counts, **{f"session_{k}": v for k, v in _mail_state.items() if k != 'started'})
 
 # ✅ [복구된 기능] 기존 데이터 재표준화 (수동 버튼용)
-def standardize_existing_data():
-    conn = sqlite3.connect(INVENTORY_DB)
-    c = conn.cursor()
-    # 모든 차량 데이터 조회
-    df = pd.read_sql("SELECT vin, manufacturer, model_name FROM vehicle_data", conn)
-    count = 0
-    for _, row in df.iterrows():
-        std_mfr, std_mod, std_det = normalize_row(row)
-        # 변경사항이 있으면 업데이트
-        if std_mfr != row['manufacturer'] or std_mod != row['model_name']:
-            c.execute("UPDATE vehicle_data SET manufacturer = ?, model_name = ?, model_detail = ? WHERE vin = ?", 
-                      (std_mfr, std_mod, std_det, row['vin']))
-            count += 1
-    conn.commit()
-    conn.close()
-    # 모델 리스트 갱신
-    conn = sqlite3.connect(INVENTORY_DB)
-    conn.execute("DELETE FROM model_list")
-    conn.execute("INSERT OR IGNORE INTO model_list (manufacturer, model_name) SELECT DISTINCT manufacturer, model_name FROM vehicle_data")
-    conn.commit()
-    conn.close()
-    return count
\ No newline at end of file
+# 규칙 버전이 오래된 행만, (제조사, 모델) 고유 조합 단위로 표준화 → 행 수 기준 배치 트랜잭션으로 반영
+# 배치 사이에 쓰기 락을 놓으므로 업로드/파트너 수정이 전체 작업 동안 막히지 않음
+STANDARDIZE_BATCH_ROWS = 20000
+
+def standardize_existing_data(progress=None, batch_rows=STANDARDIZE_BATCH_ROWS):
+    # progress(처리 행 수, 대상 행 수) → 변경된 행 수
+    version = rules_version()
+    with read_conn(INVENTORY_DB) as conn:
+        pairs = conn.execute('''SELECT manufacturer, model_name, COUNT(*) FROM vehicle_data WHERE norm_version < ?
+                                GROUP BY manufacturer, model_name''', (version,)).fetchall()
+    total, done, changed = sum(p[2] for p in pairs), 0, 0
+    if progress: progress(0, total)
+
+    batch, batch_n = [], 0
+    for i, (mfr, model, n) in enumerate(pairs):
+        batch.append((mfr, model, n)); batch_n += n
+        if batch_n < batch_rows and i + 1 < len(pairs): continue
+        fix, stamp = [], []
+        for mfr, model, n in batch:
+            std_mfr, std_mod, std_det = NORMALIZER.normalize('' if mfr is None else str(mfr), '' if model is None else str(model))
+            if std_mfr != mfr or std_mod != model:
+                fix.append((std_mfr, std_mod, std_det, version, version, mfr, model))
+                changed += n
+            else:
+                stamp.append((version, version, mfr, model))
+        with write_conn(INVENTORY_DB) as conn:
+            conn.executemany('''UPDATE vehicle_data SET manufacturer = ?, model_name = ?, model_detail = ?, norm_version = ?
+                                WHERE norm_version < ? AND manufacturer IS ? AND model_name IS ?''', fix)
+            conn.executemany("UPDATE vehicle_data SET norm_version = ? WHERE norm_version < ? AND manufacturer IS ? AND model_name IS ?", stamp)
+            conn.executemany("INSERT OR IGNORE INTO model_list (manufacturer, model_name) VALUES (?, ?)", list({(f[0], f[1]) for f in fix}))
+        if fix: bump_generation('inventory')
+        done += batch_n
+        batch, batch_n = [], 0
+        if progress: progress(done, total)
+
+    # 모델 목록을 현재 재고 기준으로 맞춤: 빠진 조합 추가 (이전 버전 DB 는 목록이 불완전할 수 있음) + 쓰이지 않는 조합 삭제
+    # 둘 다 제조사/모델 인덱스만 읽음
+    with write_conn(INVENTORY_DB) as conn:
+        fixed = conn.execute("INSERT OR IGNORE INTO model_list (manufacturer, model_name) SELECT DISTINCT manufacturer, model_name FROM vehicle_data").rowcount
+        fixed += conn.execute('''DELETE FROM model_list WHERE NOT EXISTS (SELECT 1 FROM vehicle_data v
+                                 WHERE v.manufacturer = model_list.manufacturer AND v.model_name = model_list.model_name)''').rowcount
+    if changed or fixed: bump_generation('inventory')
+    return changed
+
+# 백그라운드 작업 모드: 버튼은 시작만 하고 진행 상황은 standardize_job_status() 로 조회
+_standardize_lock = threading.Lock()
+_standardize_job = {'running': False, 'done': 0, 'total': 0, 'changed': None, 'error': None, 'started': None, 'finished': None}
+
+def _run_standardize_job():
+    def on_progress(done, total):
+        _standardize_job.update(done=done, total=total)
+    try:
+        _standardize_job['changed'] = standardize_existing_data(progress=on_progress)
+    except Exception as e:
+        print(f"Standardize Error: {e}")
+        _standardize_job['error'] = str(e)
+    finally:
+        _standardize_job.update(running=False, finished=time.time())
+
+def start_standardize_job():
+    # 이미 실행 중이면 False
+    with _standardize_lock:
+        if _standardize_job['running']: return False
+        _standardize_job.update(running=True, done=0, total=0, changed=None, error=None, started=time.time(), finished=None)
+    threading.Thread(target=_run_standardize_job, daemon=True).start()
+    return True
+
+def standardize_job_status():
+    return dict(_standardize_job)
@@ -0,0 +1,81 @@
+# modules/images.py
+import os
+import hashlib
+import tempfile
+from PIL import Image, ImageOps, features
+
+# ---------------------------------------------------------
+# 사진 변환본 (썸네일 / 중간 크기) 생성
+# ---------------------------------------------------------
+# 원본 옆에 '{원본 이름}.{변환명}.webp' 로 저장 (WebP 미지원 빌드면 JPEG)
+# 상세 화면 대표 사진 = medium, 추가 사진 타일/파트너 미리보기 = thumb → 원본(수 MB)은 화면에 보내지 않음
+RENDITIONS = {'thumb': 400, 'medium': 1280}   # 긴 변 최대 픽셀
+WEBP_QUALITY = 78
+JPEG_QUALITY = 82
+RENDITION_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+RENDITION_EXT = '.webp' if RENDITION_FORMAT == 'WEBP' else '.jpg'
+
+def rendition_path(path, name):
+    return f"{path}.{name}{RENDITION_EXT}"
+
+def _save(im, path):
+    if RENDITION_FORMAT == 'WEBP':
+        im.save(path, 'WEBP', quality=WEBP_QUALITY, method=4)
+    else:
+        if im.mode != 'RGB': im = im.convert('RGB')
+        im.save(path, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+
+def make_renditions(path):
+    # 원본 → {변환명: 경로}. 큰 변환부터 만들고 작은 변환은 직전 결과에서 축소 (원본 디코딩 1회)
+    # JPEG 는 draft 로 디코딩 단계에서 1/2~1/8 축소 → 카메라 원본도 빠르게 처리
+    out = {}
+    with Image.open(path) as src:
+        src.draft('RGB', (max(RENDITIONS.values()),) * 2)
+        im = ImageOps.exif_transpose(src)
+        if im.mode not in ('RGB', 'RGBA'): im = im.convert('RGBA' if 'A' in im.getbands() else 'RGB')
+        for name, edge in sorted(RENDITIONS.items(), key=lambda x: -x[1]):
+            im.thumbnail((edge, edge), Image.LANCZOS)
+            dst = rendition_path(path, name)
+            tmp = dst + '.tmp'
+            _save(im, tmp)
+            os.replace(tmp, dst)
+            out[name] = dst
+    return out
+
+# ---------------------------------------------------------
+# 내용 주소 저장 (sha256 → 파일 경로)
+# ---------------------------------------------------------
+# 원본은 '{IMAGE_DIR}/{해시 앞 2자리}/{해시}{확장자}' 한 벌만 저장 → 같은 사진 재업로드/동시 업로드 충돌 없음
+# 업로드는 청크 단위로 임시 파일에 쓰면서 해시 계산 (전체를 메모리에 올리지 않음)
+CHUNK_SIZE = 1 << 20
+
+def blob_path(image_dir, digest, ext):
+    return os.path.join(image_dir, digest[:2], digest + ext)
+
+def stream_to_temp(f, image_dir):
+    # 업로드 파일 → (임시 경로, sha256, 크기). 임시 파일은 같은 볼륨에 만들어 os.replace 로 이동
+    h, size = hashlib.sha256(), 0
+    fd, tmp = tempfile.mkstemp(dir=image_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                h.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except:
+        os.remove(tmp)
+        raise
+    return tmp, h.hexdigest(), size
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''): h.update(chunk)
+    return h.hexdigest()
+
+def image_size(path):
+    # 헤더만 읽어 (width, height), 이미지가 아니면 (None, None)
+    try:
+        with Image.open(path) as im: return im.size
+    except:
+        return None, None
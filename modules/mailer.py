@@ -0,0 +1,130 @@
+# modules/mailer.py
+import os
+import ssl
+import base64
+import smtplib
+import tempfile
+import uuid
+from email.header import Header
+from email.utils import formatdate, make_msgid, encode_rfc2231
+
+# ---------------------------------------------------------
+# SMTP 전송 (연결 재사용 + 메시지 스트리밍)
+# ---------------------------------------------------------
+# - SmtpSession: 한 번 인증한 연결로 여러 통 전송, 끊기면 다음 전송 때 재연결
+# - 메시지는 임시 파일(SpooledTemporaryFile)에 MIME 으로 쓰고 DATA 단계에서 청크 단위로 전송
+#   → 첨부파일은 57KB 단위로 base64 인코딩 (전체를 메모리에 올리지 않음)
+# - config: {'smtp_server', 'smtp_port', 'sender_email', 'sender_password', 'use_tls'(기본 True), 'use_ssl'}
+#   로컬 테스트 서버는 use_tls=False, sender_password='' 로 인증 없이 사용
+SPOOL_MAX = 1 << 20
+SEND_BUFFER = 1 << 16
+B64_CHUNK = 57 * 1024          # 57바이트 = base64 한 줄(76자)
+
+class PermanentMailError(Exception):
+    pass
+
+def _header(v):
+    return Header(str(v), 'utf-8').encode()
+
+def _b64_lines(data):
+    return base64.encodebytes(data).replace(b'\n', b'\r\n')
+
+def write_message(out, sender, to, subject, body, attachments=()):
+    # attachments: [(경로, 파일명), ...] — 파일에서 바로 읽어 인코딩
+    boundary = f"=_{uuid.uuid4().hex}"
+    head = [f"From: {sender}", f"To: {to}", f"Subject: {_header(subject)}", f"Date: {formatdate(localtime=True)}",
+            f"Message-ID: {make_msgid()}", "MIME-Version: 1.0", f'Content-Type: multipart/mixed; boundary="{boundary}"', "", "",
+            f"--{boundary}", 'Content-Type: text/plain; charset="utf-8"', "Content-Transfer-Encoding: base64", "", ""]
+    out.write("\r\n".join(head).encode())
+    out.write(_b64_lines(str(body).encode('utf-8')))
+    for path, name in attachments:
+        fname = encode_rfc2231(name, 'utf-8')
+        part = [f"--{boundary}", f"Content-Type: application/octet-stream; name*={fname}",
+                f"Content-Disposition: attachment; filename*={fname}", "Content-Transfer-Encoding: base64", "", ""]
+        out.write("\r\n".join(part).encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(B64_CHUNK), b''): out.write(_b64_lines(chunk))
+    out.write(f"--{boundary}--\r\n".encode())
+
+class SmtpSession:
+    def __init__(self, config, timeout=30):
+        self.config = dict(config)
+        self.timeout = timeout
+        self.server = None
+        self.sent = 0
+
+    def _connect(self):
+        cfg = self.config
+        host, port = cfg['smtp_server'], int(cfg.get('smtp_port') or 587)
+        if cfg.get('use_ssl'):
+            server = smtplib.SMTP_SSL(host, port, timeout=self.timeout, context=ssl.create_default_context())
+        else:
+            server = smtplib.SMTP(host, port, timeout=self.timeout)
+            server.ehlo()
+            if cfg.get('use_tls', True):
+                server.starttls(context=ssl.create_default_context())
+                server.ehlo()
+        if cfg.get('sender_password'):
+            server.login(cfg['sender_email'], cfg['sender_password'])
+        self.server = server
+
+    def close(self):
+        if self.server is None: return
+        try: self.server.quit()
+        except: pass
+        self.server = None
+
+    def _transmit(self, rcpts, fp):
+        s = self.server
+        code, resp = s.mail(self.config['sender_email'])
+        if code != 250: raise smtplib.SMTPSenderRefused(code, resp, self.config['sender_email'])
+        for r in rcpts:
+            code, resp = s.rcpt(r)
+            if code not in (250, 251): raise smtplib.SMTPRecipientsRefused({r: (code, resp)})
+        code, resp = s.docmd('data')
+        if code != 354: raise smtplib.SMTPDataError(code, resp)
+        # 줄 단위 dot-stuffing 후 버퍼 단위로 전송
+        buf = bytearray()
+        for line in fp:
+            if line.startswith(b'.'): buf += b'.'
+            buf += line
+            if len(buf) >= SEND_BUFFER:
+                s.send(bytes(buf)); buf.clear()
+        s.send(bytes(buf) + b'.\r\n')
+        code, resp = s.getreply()
+        if code != 250: raise smtplib.SMTPDataError(code, resp)
+
+    def send(self, to, subject, body, attachments=()):
+        # 실패 시 예외: 5xx 응답은 PermanentMailError (재시도 안 함), 그 외는 재시도 대상
+        rcpts = [a.strip() for a in str(to).split(',') if a.strip()]
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX) as fp:
+            write_message(fp, self.config['sender_email'], ', '.join(rcpts), subject, body, attachments)
+            for attempt in range(2):
+                fp.seek(0)
+                try:
+                    if self.server is None: self._connect()
+                    self._transmit(rcpts, fp)
+                    self.sent += 1
+                    return
+                except smtplib.SMTPServerDisconnected:
+                    # 유휴 중 서버가 끊은 연결 → 한 번만 재연결
+                    self.server = None
+                    if attempt: raise
+                except smtplib.SMTPRecipientsRefused as e:
+                    self._reset()
+                    codes = [c for c, _ in e.recipients.values()]
+                    if all(c >= 500 for c in codes): raise PermanentMailError(str(e.recipients))
+                    raise
+                except smtplib.SMTPResponseException as e:
+                    self._reset()
+                    if e.smtp_code >= 500 and not isinstance(e, smtplib.SMTPAuthenticationError): raise PermanentMailError(str(e))
+                    raise
+
+    def _reset(self):
+        try: self.server.rset()
+        except:
+            self.close()
+
+def attachment_name(path):
+    # 보관 파일명 '{uuid}_{원래 이름}' → 원래 이름
+    return os.path.basename(path).split('_', 1)[-1]
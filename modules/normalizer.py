@@ -0,0 +1,78 @@
+# modules/normalizer.py
+import re
+import json
+import hashlib
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# ---------------------------------------------------------
+# 제조사/모델명 표준화 엔진 (정규식 사전 컴파일 + 접두어 트라이 + 메모이제이션)
+# ---------------------------------------------------------
+_END = object()
+
+class Normalizer:
+    def __init__(self, brand_map, model_map, brand_remove_regex, garbage_terms, cache_size=65536):
+        self.brand_map = dict(brand_map)
+        self.brand_remove = re.compile(brand_remove_regex, flags=re.IGNORECASE)
+        self.garbage = set(t.upper() for t in garbage_terms)
+
+        # 대문자 키 기준 트라이: 가장 긴 접두어 매칭을 모델명 길이에 비례하는 시간에 찾음
+        # 키별 치환 정규식도 미리 컴파일 (세부모델 추출용)
+        self.trie = {}
+        for k, v in model_map.items():
+            node = self.trie
+            for ch in k.upper():
+                node = node.setdefault(ch, {})
+            if _END not in node:
+                node[_END] = (k, v, re.compile(re.escape(k), flags=re.IGNORECASE))
+
+        self.normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
+        # 규칙 지문: 사전/정규식이 바뀌면 달라짐 → 저장된 행의 표준화 버전 비교용
+        rules = [sorted(brand_map.items()), sorted(model_map.items()), brand_remove_regex, sorted(garbage_terms)]
+        self.digest = hashlib.sha1(json.dumps(rules, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def match_model(self, text):
+        node, best = self.trie, None
+        for ch in text.upper():
+            node = node.get(ch)
+            if node is None: break
+            if _END in node: best = node[_END]
+        return best
+
+    def _normalize(self, raw_mfr, raw_model):
+        raw_mfr, raw_model = str(raw_mfr).strip(), str(raw_model).strip()
+        std_mfr = self.brand_map.get(raw_mfr, raw_mfr)
+        if std_mfr == '현대': std_mfr = 'Hyundai'
+        clean_model = self.brand_remove.sub("", raw_model).strip()
+        if clean_model.upper() in self.garbage: clean_model = "Unknown"
+
+        std_model, std_detail = clean_model, ""
+        hit = self.match_model(clean_model)
+        if hit:
+            k, std_model, pattern = hit
+            if clean_model.upper() != k.upper():
+                std_detail = pattern.sub("", clean_model).strip()
+        std_detail = std_detail.replace("(", "").replace(")", "").strip()
+        if std_model.upper() in self.garbage: std_model = "Unknown"
+        return std_mfr, std_model, std_detail
+
+    def normalize_series(self, mfr, model):
+        # 배치 API: (제조사, 모델) 고유 조합만 표준화한 뒤 코드 배열로 펼침 → (mfr, model, detail) Series
+        mfr = pd.Series(mfr).fillna('').astype(str).str.strip()
+        model = pd.Series(model, index=mfr.index).fillna('').astype(str).str.strip()
+        codes, uniques = pd.factorize(pd.MultiIndex.from_arrays([mfr.values, model.values]))
+        if len(uniques) == 0:
+            empty = pd.Series([], index=mfr.index, dtype=object)
+            return empty, empty.copy(), empty.copy()
+        results = np.array([self.normalize(a, b) for a, b in uniques], dtype=object)
+        out = results[codes]
+        return (pd.Series(out[:, 0], index=mfr.index), pd.Series(out[:, 1], index=mfr.index),
+                pd.Series(out[:, 2], index=mfr.index))
+
+    def cache_info(self):
+        return self.normalize.cache_info()
+
+    def clear_cache(self):
+        self.normalize.cache_clear()
@@ -0,0 +1,74 @@
+# modules/query_cache.py
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+# ---------------------------------------------------------
+# 세대(generation) 기반 결과 캐시 (세션 공용, LRU)
+# ---------------------------------------------------------
+# 키 = (함수명, 데이터 세대, 정규화된 인자). 세대가 바뀌면 이전 키는 더 이상 조회되지 않고 LRU로 밀려남
+# 값은 피클 복사 없이 그대로 공유하므로 호출 측에서 결과 DataFrame을 직접 수정하면 안 됨 (copy 후 수정)
+
+def _freeze(v):
+    # 리스트/셋 필터는 순서 무관하게 정렬된 튜플로 (['기아','현대'] == ['현대','기아'])
+    if isinstance(v, (list, tuple, set, frozenset)):
+        items = [_freeze(x) for x in v]
+        try: items = sorted(items)
+        except TypeError: pass
+        return tuple(items)
+    if isinstance(v, dict):
+        return tuple(sorted((k, _freeze(x)) for k, x in v.items()))
+    if isinstance(v, str):
+        return v.strip()
+    return v
+
+class QueryCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return True, self._data[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'hit_rate': round(self.hits / total, 3) if total else 0.0}
+
+    def cached(self, generation):
+        # generation: 현재 데이터 세대를 돌려주는 함수 (예: lambda: get_generation('inventory'))
+        def deco(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                key = (fn.__name__, generation(), _freeze(args), _freeze(kwargs))
+                found, value = self.get(key)
+                if found: return value
+                value = fn(*args, **kwargs)
+                self.put(key, value)
+                return value
+            wrapper.uncached = fn
+            return wrapper
+        return deco
@@ -1,10 +1,8 @@
 # modules/utils.py
 import hashlib
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
-import streamlit as st
+from functools import lru_cache
+import numpy as np
+import pandas as pd
 import modules.constants as const
 
 def make_hashes(password):
@@ -15,48 +13,26 @@ def check_hashes(password, hashed_text):
     return False
 
 def send_email(to_email, subject, content, attachment_files=[]):
-    if "@" not in to_email: return False
-    try:
-        if "EMAIL" not in st.secrets: return False
-        
-        smtp_server = st.secrets["EMAIL"]["smtp_server"]
-        smtp_port = st.secrets["EMAIL"]["smtp_port"]
-        sender_email = st.secrets["EMAIL"]["sender_email"]
-        sender_password = st.secrets["EMAIL"]["sender_password"]
-
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(content, 'plain'))
-
-        if attachment_files:
-            files = attachment_files if isinstance(attachment_files, list) else [attachment_files]
-            for file in files:
-                try:
-                    file.seek(0)
-                    file_data = file.read()
-                    fname = file.name if hasattr(file, 'name') else "attachment"
-                    part = MIMEApplication(file_data, Name=fname)
-                    part['Content-Disposition'] = f'attachment; filename="{fname}"'
-                    msg.attach(part)
-                except: continue
-
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
-        return True
-    except: return False
+    # 발송함에 넣고 바로 반환 (실제 발송은 db 의 백그라운드 발송 스레드)
+    from modules import db
+    return db.queue_email(to_email, subject, content, attachment_files)
 
+@lru_cache(maxsize=4096)
 def generate_alias(real_name):
     if not isinstance(real_name, str): return "Unknown"
     hash_object = hashlib.md5(str(real_name).encode())
     hash_int = int(hash_object.hexdigest(), 16) % 900 + 100 
     return f"Partner #{hash_int}"
 
+# 재고 업로드로 자동 등록된 폐차장의 주소 자리표시 (주소 파일 업로드 전)
+UNKNOWN_ADDRESS = '주소 미등록'
+
+def is_unknown_address(addr):
+    return not isinstance(addr, str) or not addr.strip() or addr in ("검색실패", UNKNOWN_ADDRESS) or "조회" in addr
+
+@lru_cache(maxsize=16384)
 def translate_address(addr, lang='English'):
-    if not isinstance(addr, str) or addr == "검색실패" or "조회" in addr: return "Unknown Address"
+    if is_unknown_address(addr): return "Unknown Address"
     parts = addr.split()
     if len(parts) < 2: return "South Korea"
     k_do, k_city = parts[0][:2], parts[1]
@@ -76,34 +52,71 @@ def translate_address(addr, lang='English'):
         if en_city != city_core: return f"{en_do}, {en_city}{suffix}"
         else: return f"{en_do}, Korea"
 
+def region_code(addr):
+    # 주소 첫 토큰(시/도) → 'KR-41' 형식 코드 (알 수 없으면 '')
+    if not isinstance(addr, str) or not addr.split(): return ''
+    return const.REGION_CODES.get(const.PROVINCE_MAP.get(addr.split()[0][:2]), '')
+
+# 시/도 코드 → 화면 언어별 이름 (PROVINCE_MAP 의 두 글자 키 기준), 모르는 코드는 None
+_REGION_KEYS = {const.REGION_CODES[v]: k for k, v in const.PROVINCE_MAP.items() if len(k) == 2}
+
+def region_name(code, lang='English'):
+    k = _REGION_KEYS.get(code)
+    if k is None: return None
+    if lang == 'Korean': return k
+    if lang == 'Russian': return const.PROVINCE_MAP_RU.get(k)
+    if lang == 'Arabic': return const.PROVINCE_MAP_AR.get(k)
+    return const.PROVINCE_MAP[k]
+
+def junkyard_address_fields(addr):
+    # junkyard_info 저장용: (address_en, address_ru, address_ar, region_code), 주소를 모르면 NULL → 화면에서 지역 숨김
+    if is_unknown_address(addr): return None, None, None, ''
+    return (translate_address(addr, 'English'), translate_address(addr, 'Russian'),
+            translate_address(addr, 'Arabic'), region_code(addr))
+
+def map_unique(series, fn):
+    # 폐차장/주소는 수백 종류뿐이므로 고유값에만 fn 적용 후 코드 배열로 펼침 (NaN/None 포함)
+    codes, uniques = pd.factorize(series)
+    table = np.array([fn(u) for u in uniques] + [fn(None)], dtype=object)
+    return pd.Series(table[codes], index=series.index)
+
+def mask_vin(series):
+    s = series.astype(str)
+    return (s.str.slice(0, 8) + "****").where(s.str.len() > 8, "****")
+
 def mask_dataframe(df, role, lang='English'):
     if df.empty: return df
-    df_safe = df.copy()
+    # 컬럼 단위로만 교체하므로 얕은 복사로 충분
+    df_safe = df.copy(deep=False)
     
     if role in ['admin', 'partner']:
         if 'junkyard' in df_safe.columns:
-            df_safe['partner_alias'] = df_safe['junkyard'].apply(generate_alias)
+            df_safe['partner_alias'] = map_unique(df_safe['junkyard'], generate_alias)
         return df_safe
 
     if 'junkyard' in df_safe.columns:
         df_safe['real_junkyard'] = df_safe['junkyard']
         if role == 'buyer':
-            df_safe['junkyard'] = df_safe['junkyard'].apply(generate_alias)
+            df_safe['junkyard'] = map_unique(df_safe['junkyard'], generate_alias)
         else:
             df_safe['junkyard'] = "🔒 Login Required"
 
     if 'address' in df_safe.columns:
         if role == 'buyer':
-            df_safe['address'] = df_safe['address'].apply(lambda x: translate_address(x, lang))
+            # search_data(lang=...)가 미리 번역된 주소(address_local)를 주면 그대로 사용
+            if 'address_local' in df_safe.columns:
+                df_safe['address'] = df_safe['address_local']
+            else:
+                df_safe['address'] = map_unique(df_safe['address'], lambda x: translate_address(x, lang))
             if 'region' in df_safe.columns:
-                df_safe['region'] = df_safe['address'].apply(lambda x: x.split(',')[0] if ',' in str(x) else x)
+                df_safe['region'] = map_unique(df_safe['address'], lambda x: x.split(',')[0] if ',' in str(x) else x)
         else:
             df_safe['address'] = "🔒 Login Required"
             df_safe['region'] = "🔒"
 
     if 'vin' in df_safe.columns:
-        df_safe['vin'] = df_safe['vin'].astype(str).apply(lambda x: x[:8] + "****" if len(x) > 8 else "****")
+        df_safe['vin'] = mask_vin(df_safe['vin'])
     
-    drop_cols = ['car_no', 'lat', 'lon', 'real_junkyard']
+    drop_cols = ['car_no', 'lat', 'lon', 'real_junkyard', 'address_local']
     df_safe = df_safe.drop(columns=[c for c in drop_cols if c in df_safe.columns], errors='ignore')
-    return df_safe
\ No newline at end of file
+    return df_safe